@@ -0,0 +1,313 @@
+# Standard library imports
+import argparse
+import os
+import sqlite3
+import time
+
+# Local application imports
+from guide import assess_metric, message_text
+from safe_writes import appended_row_number, find_value_row
+from sharding import open_or_create
+from sheet_reader import iter_rows, read_cell
+from sheets import (
+    current_tenant,
+    get_spreadsheet,
+    operation,
+    tenant_path,
+    use_tenant
+)
+from validation import ROM_BY_TEXT, WEIGHT_BEARING_BY_TEXT
+
+# Alerts are kept in the tenant's own spreadsheet, so every web
+# process and clinician sees the same queue and it survives a
+# restart of a host with a throwaway disk, such as Heroku dynos.
+# The SQLite file is only a local cache of that worksheet, used to
+# filter and page through it, and is rebuilt from the sheet on read.
+WORKSHEET_ALERTS = "alerts"
+ALERT_HEADERS = [
+    "Submission ID", "Username", "Metric", "Severity", "Week Band",
+    "Days Since Surgery", "Message", "Submitted At", "Acknowledged"
+]
+SUBMISSION_COLUMN = ALERT_HEADERS.index("Submission ID") + 1
+ACKNOWLEDGED_COLUMN = ALERT_HEADERS.index("Acknowledged") + 1
+
+ALERTS_DB = os.environ.get("REHAB_ALERTS_DB", "alerts.db")
+PAGE_SIZE = 20
+
+# Severity names ranked so the worst sort first
+SEVERITY_RANKS = {"high": 3, "medium": 2, "low": 1}
+
+# Alert severity of the guide.py messages that need clinician review
+SEVERITIES = {
+    "rom_poor_0_2": "medium",
+    "rom_poor_2_6": "medium",
+    "rom_poor_6_12": "medium",
+    "rom_poor_12": "medium",
+    "pain_high_0_2": "low",
+    "pain_high_2_6": "medium",
+    "pain_concerning_6_12": "high",
+    "pain_significant_12": "high",
+    "pain_elevated_12": "medium",
+    "weight_bearing_poor_0_2": "high",
+    "weight_bearing_below_consult": "high",
+    "weight_bearing_below_continue": "low",
+    "weight_bearing_lower_consult": "medium",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    submission_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    severity_rank INTEGER NOT NULL,
+    week_band TEXT NOT NULL,
+    days_since_surgery INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    acknowledged INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (submission_id, metric)
+);
+CREATE INDEX IF NOT EXISTS alerts_by_severity
+    ON alerts (acknowledged, severity_rank DESC, submitted_at DESC);
+CREATE INDEX IF NOT EXISTS alerts_by_band
+    ON alerts (acknowledged, week_band, submitted_at DESC);
+CREATE INDEX IF NOT EXISTS alerts_by_time
+    ON alerts (acknowledged, submitted_at DESC);
+"""
+
+
+def connect(path=None):
+    """
+    Opens the local alerts cache, creating the table and indexes.
+    Each tenant has its own cache file.
+    Alert ids are the alert's row number in the alerts worksheet.
+    """
+    connection = sqlite3.connect(path or tenant_path(ALERTS_DB), timeout=5)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def evaluate_alerts(data):
+    """
+    Runs the timeline assessments for a userdata row and
+    returns (Assessment, severity) for each poor result.
+    """
+    days = int(data[3])
+    answers = (
+        ("rom", ROM_BY_TEXT.get(data[6])),
+        ("pain", data[5]),
+        ("weight_bearing", WEIGHT_BEARING_BY_TEXT.get(data[7])),
+    )
+    alerts = []
+    for metric, level in answers:
+        result = assess_metric(metric, level, days)
+        severity = SEVERITIES.get(result.message_id)
+        if severity:
+            alerts.append((result, severity))
+    return alerts
+
+
+def get_alerts_worksheet(tenant=None):
+    """
+    Returns the tenant's alerts worksheet, adding it if missing.
+    """
+    return open_or_create(
+        get_spreadsheet(tenant or current_tenant()), WORKSHEET_ALERTS,
+        ALERT_HEADERS
+    )
+
+
+def cache_rows(connection, rows):
+    """
+    Writes (row number, alerts worksheet row) pairs to the cache.
+    """
+    connection.executemany(
+        "INSERT OR REPLACE INTO alerts (id, submission_id, username, "
+        "metric, severity, severity_rank, week_band, "
+        "days_since_surgery, message, submitted_at, acknowledged) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (row_number, submission_id, username, metric, severity,
+             SEVERITY_RANKS.get(severity, 0), band, int(days or 0),
+             message, float(submitted_at or 0), int(acknowledged or 0))
+            for row_number, (submission_id, username, metric, severity,
+                             band, days, message, submitted_at,
+                             acknowledged) in rows
+            if submission_id
+        ]
+    )
+
+
+def record_alerts(data, submission_id, check_existing=False, path=None):
+    """
+    Evaluates a userdata row and appends any alerts to the
+    alerts worksheet, in one write per submission.
+    check_existing skips submissions already in the worksheet,
+    for rows replayed from the write journal.
+    The new alerts are copied to the local cache as well.
+    Returns the number of alerts found.
+    """
+    alerts = evaluate_alerts(data)
+    if not alerts:
+        return 0
+    worksheet = get_alerts_worksheet()
+    if check_existing and find_value_row(
+        worksheet, submission_id, SUBMISSION_COLUMN
+    ) is not None:
+        return len(alerts)
+    days = int(data[3])
+    now = time.time()
+    rows = [
+        [submission_id, data[0], result.metric, severity, result.band,
+         days, message_text(result), now, 0]
+        for result, severity in alerts
+    ]
+    with operation("record_alerts"):
+        response = worksheet.append_rows(rows)
+    first_row = appended_row_number(response)
+    if first_row is not None:
+        connection = connect(path)
+        try:
+            with connection:
+                cache_rows(connection, enumerate(rows, first_row))
+        finally:
+            connection.close()
+    return len(alerts)
+
+
+def sync_alerts(path=None):
+    """
+    Rebuilds the local cache from the alerts worksheet, so alerts
+    recorded or acknowledged by other processes are included.
+    """
+    rows = iter_rows(
+        get_alerts_worksheet(), width=len(ALERT_HEADERS),
+        label="sync_alerts"
+    )
+    connection = connect(path)
+    try:
+        with connection:
+            connection.execute("DELETE FROM alerts")
+            cache_rows(connection, rows)
+    finally:
+        connection.close()
+
+
+def list_alerts(severity=None, band=None, page=1, page_size=PAGE_SIZE,
+                include_acknowledged=False, sync=True, path=None):
+    """
+    Returns one page of alerts, worst and newest first.
+    The cache is refreshed from the worksheet first unless
+    sync is False.
+    Filters use the indexes on severity, week band and time.
+    """
+    if sync:
+        sync_alerts(path)
+    clauses = []
+    params = []
+    if not include_acknowledged:
+        clauses.append("acknowledged = 0")
+    if severity:
+        clauses.append("severity_rank = ?")
+        params.append(SEVERITY_RANKS[severity])
+    if band:
+        clauses.append("week_band = ?")
+        params.append(band)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    params.extend([page_size, (page - 1) * page_size])
+    connection = connect(path)
+    try:
+        return connection.execute(
+            "SELECT id, severity, week_band, username, metric, "
+            "days_since_surgery, submitted_at, message FROM alerts "
+            f"{where} ORDER BY severity_rank DESC, submitted_at DESC "
+            "LIMIT ? OFFSET ?",
+            params
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def acknowledge_alert(alert_id, path=None):
+    """
+    Marks an alert as reviewed so it leaves the open queue.
+    The worksheet is updated first, then the local cache.
+    Returns False if there is no alert with that id.
+    """
+    if alert_id < 2:
+        return False
+    worksheet = get_alerts_worksheet()
+    if not read_cell(
+        worksheet, alert_id, SUBMISSION_COLUMN, "acknowledge_alert"
+    ):
+        return False
+    with operation("acknowledge_alert"):
+        worksheet.update_cell(alert_id, ACKNOWLEDGED_COLUMN, 1)
+    connection = connect(path)
+    try:
+        with connection:
+            connection.execute(
+                "UPDATE alerts SET acknowledged = 1 WHERE id = ?",
+                (alert_id,)
+            )
+    finally:
+        connection.close()
+    return True
+
+
+def print_alerts(rows):
+    """
+    Prints a page of alerts for clinicians.
+    """
+    print("-" * 50)
+    if not rows:
+        print("No alerts to review.")
+    for (alert_id, severity, band, username, metric, days, submitted_at,
+         message) in rows:
+        submitted = time.strftime(
+            "%d/%m/%Y %H:%M", time.localtime(submitted_at)
+        )
+        print(f"#{alert_id} [{severity.upper()}] Week {band} "
+              f"(day {days}) {username} - {metric} - {submitted}")
+        print(f"    {message}")
+    print("-" * 50)
+
+
+def main(argv=None):
+    """
+    Clinician command to page through and acknowledge alerts.
+    """
+    parser = argparse.ArgumentParser(
+        description="Review Rehab Metrics risk alerts."
+    )
+    parser.add_argument("--tenant", help="Clinic to review alerts for.")
+    parser.add_argument("--severity", choices=sorted(SEVERITY_RANKS))
+    parser.add_argument("--band", choices=["0-2", "2-6", "6-12", "12+"])
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--all", action="store_true",
+                        help="Include acknowledged alerts.")
+    parser.add_argument("--ack", type=int, metavar="ID",
+                        help="Acknowledge an alert by id.")
+    options = parser.parse_args(argv)
+    if options.tenant:
+        use_tenant(options.tenant)
+    if options.ack:
+        if acknowledge_alert(options.ack):
+            print(f"Alert #{options.ack} acknowledged.")
+        else:
+            print(f"No alert #{options.ack}.")
+        return
+    print_alerts(list_alerts(
+        severity=options.severity,
+        band=options.band,
+        page=options.page,
+        page_size=options.page_size,
+        include_acknowledged=options.all
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+# Standard library imports
+import argparse
+import json
+import os
+import re
+import secrets
+import threading
+import time
+
+# Local application imports
+from guide import message_text
+from metrics import dump as dump_metrics, inc, observe
+from reference import placement_message
+from run import (
+    SUBMISSION_ID_COLUMN,
+    assess_pain_progress,
+    assess_rom_progress,
+    assess_weight_bearing_progress,
+    build_metric_row,
+    check_existing_username,
+    format_user_data,
+    get_user_metric_data,
+    load_reference,
+    queue_alerts,
+    validate_password,
+    validate_user,
+    verify_password
+)
+from safe_writes import (
+    append_once,
+    append_username,
+    appended_row_number,
+    release_username,
+    reserve_username
+)
+from sharding import WRITE_BATCH, get_userdata_worksheet, prepare_for_write
+from sheet_reader import has_header
+from sheets import (
+    DEFAULT_TENANT,
+    WORKSHEET_USERS,
+    close_clients,
+    current_tenant,
+    get_worksheet,
+    use_tenant
+)
+from snapshot import reset as reset_snapshot, store_row
+from throttle import allow_login, login_succeeded
+from upsert import upsert_enabled, upsert_rows
+from validation import parse_answers
+
+# Seconds a login token stays valid
+TOKEN_TTL = float(os.environ.get("REHAB_API_TOKEN_TTL", "1800"))
+# Seconds the reference curves are reused before new rows are read
+REFERENCE_TTL = float(os.environ.get("REHAB_API_REFERENCE_TTL", "60"))
+# Seconds between merges of this process's metrics into METRICS_DB
+METRICS_INTERVAL = 15
+# Header a trusted proxy in front of the API sets to the client
+# address, e.g. X-Forwarded-For. Without it logins are limited per
+# TCP peer address, which is the proxy's when there is one.
+CLIENT_HEADER = os.environ.get("REHAB_API_CLIENT_HEADER", "")
+
+# Most requests one batch may hold, and the largest body accepted
+MAX_BATCH = 100
+MAX_BODY = 1024 * 1024
+
+# Colour codes are stripped from messages written for the terminal
+COLOUR_CODE = re.compile(r"\x1b\[[0-9;]*m")
+
+# Login tokens: token -> (tenant, username, expiry time)
+TOKENS = {}
+TOKENS_LOCK = threading.Lock()
+
+# Reference curves per tenant: tenant -> (loaded at, table)
+REFERENCES = {}
+REFERENCES_LOCK = threading.Lock()
+
+
+class ApiError(Exception):
+    """
+    Raised to answer a request with an HTTP error status.
+    """
+
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.payload = {"error": message, **details}
+
+
+def plain(text):
+    """
+    Removes terminal colour codes and surrounding whitespace.
+    """
+    return COLOUR_CODE.sub("", text or "").strip()
+
+
+def issue_token(username):
+    """
+    Creates a login token for the calling thread's tenant,
+    dropping expired tokens while the lock is held.
+    """
+    token = secrets.token_urlsafe(24)
+    now = time.monotonic()
+    with TOKENS_LOCK:
+        for old in [key for key, value in TOKENS.items() if value[2] <= now]:
+            del TOKENS[old]
+        TOKENS[token] = (current_tenant(), username, now + TOKEN_TTL)
+    return token
+
+
+def token_user(body):
+    """
+    Returns the username a request's token was issued to.
+    Raises ApiError if the token is missing, expired or
+    belongs to another tenant.
+    """
+    with TOKENS_LOCK:
+        found = TOKENS.get(str(body.get("token", "")))
+    if found is None or found[2] <= time.monotonic():
+        raise ApiError(401, "Invalid or expired token.")
+    if found[0] != current_tenant():
+        raise ApiError(401, "Token belongs to another tenant.")
+    return found[1]
+
+
+def get_reference():
+    """
+    Returns the calling tenant's reference curves, read again
+    only once they are REFERENCE_TTL seconds old, so busy
+    periods do not read the userdata shards on every request.
+    """
+    tenant = current_tenant()
+    now = time.monotonic()
+    with REFERENCES_LOCK:
+        cached = REFERENCES.get(tenant)
+        if cached and now - cached[0] < REFERENCE_TTL:
+            return cached[1]
+    table = load_reference()
+    if table is not None:
+        with REFERENCES_LOCK:
+            REFERENCES[tenant] = (now, table)
+    return table
+
+
+def assessments(row, reference):
+    """
+    Assesses a userdata row with the guide rules.
+    Returns a list of assessment dictionaries.
+    """
+    results = [
+        assess_rom_progress(row),
+        assess_pain_progress(row),
+        assess_weight_bearing_progress(row)
+    ]
+    return [
+        {
+            "metric": result.metric,
+            "band": result.band,
+            "level": result.level,
+            "message_id": result.message_id,
+            "message": message_text(result),
+            "placement": plain(placement_message(
+                reference, result.metric, int(row[3]), result.level
+            ))
+        }
+        for result in results if result
+    ]
+
+
+def register(body, client):
+    """
+    Registers a username and password.
+    The username is reserved while it is checked, exactly as
+    in the terminal sign up, so concurrent requests for the
+    same name cannot both succeed.
+    """
+    username = str(body.get("username", "")).strip()
+    password = str(body.get("password", ""))
+    errors = {}
+    for field, (is_valid, message) in (
+        ("username", validate_user(username)),
+        ("password", validate_password(password)),
+    ):
+        if not is_valid:
+            errors[field] = plain(message)
+    if errors:
+        raise ApiError(400, "Invalid registration.", fields=errors)
+    token = reserve_username(username)
+    if token is None:
+        raise ApiError(409, "This username already exists.")
+    try:
+        if check_existing_username(username):
+            raise ApiError(409, "This username already exists.")
+        user_worksheet = get_worksheet(WORKSHEET_USERS)
+        headers = ["Username", "Password"]
+        if not has_header(user_worksheet, len(headers)):
+            user_worksheet.append_row(headers)
+        if not append_username(user_worksheet, username, password):
+            reset_snapshot(WORKSHEET_USERS)
+            raise ApiError(409, "This username already exists.")
+    finally:
+        release_username(username, token)
+    return 201, {"username": username}
+
+
+def login(body, client):
+    """
+    Checks a username and password and issues a token.
+    Attempts share the terminal's limiter and are refused before
+    any sheet is read. The per-connection limit applies to the
+    client address, and is skipped on the Unix socket.
+    """
+    username = str(body.get("username", "")).strip()
+    allowed, scope, wait = allow_login(
+        username, f"api:{client}" if client else None
+    )
+    if not allowed:
+        inc("rehab_login_throttled_total", scope=scope)
+        raise ApiError(429, "Too many login attempts.",
+                       retry_after=int(wait) + 1)
+    if not verify_password(username, str(body.get("password", ""))):
+        raise ApiError(401, "Incorrect username or password.")
+    login_succeeded(username)
+    return 200, {"token": issue_token(username), "expires_in": TOKEN_TTL}
+
+
+def assessment(body, client):
+    """
+    Returns the logged in user's profile and assessments.
+    """
+    username = token_user(body)
+    row = get_user_metric_data(username, get_userdata_worksheet(username))
+    if row is None:
+        raise ApiError(404, "No rehabilitation data found for this user.")
+    return 200, {
+        "profile": format_user_data(row),
+        "assessments": assessments(row, get_reference())
+    }
+
+
+def submission_row(body):
+    """
+    Parses a submission's answers into a userdata row.
+    Answers that need a safety stop are refused, as the
+    terminal stops before saving them.
+    """
+    username = token_user(body)
+    answers = body.get("answers")
+    if not isinstance(answers, dict):
+        raise ApiError(400, "answers must be an object.")
+    parsed, errors = parse_answers(answers)
+    if errors:
+        raise ApiError(
+            422, "Invalid answers.",
+            fields={key: plain(value) for key, value in errors.items()}
+        )
+    return build_metric_row(username, parsed)
+
+
+def append_rows(worksheet, rows):
+    """
+    Appends rows in batches, one request per batch.
+    If a batch fails its rows are saved one at a time with
+    append_once, which skips any the failed request wrote.
+    Written rows are added to the snapshot, so the next
+    assessment lookup returns them rather than an older row.
+    If a row number is not known the shard's snapshot is
+    dropped instead, to be reloaded on the next lookup.
+    """
+    for start in range(0, len(rows), WRITE_BATCH):
+        batch = rows[start:start + WRITE_BATCH]
+        try:
+            first_row = appended_row_number(worksheet.append_rows(batch))
+            numbered = [
+                (first_row + offset if first_row else None, row)
+                for offset, row in enumerate(batch)
+            ]
+        except Exception:
+            numbered = [
+                (append_once(worksheet, row, SUBMISSION_ID_COLUMN, True),
+                 row)
+                for row in batch
+            ]
+        for row_number, row in numbered:
+            if row_number is None:
+                reset_snapshot(worksheet.title)
+                break
+            store_row(worksheet.title, row_number, row)
+
+
+def save_rows(rows):
+    """
+    Saves userdata rows with one write per userdata shard,
+    rather than one per row as save_metric_row does.
+    A shard paused for maintenance fails the save straight away,
+    so the client can retry rather than wait.
+    Poor assessment results are queued as clinician alerts.
+    """
+    shards = {}
+    for row in rows:
+        worksheet = get_userdata_worksheet(row[0])
+        shards.setdefault(worksheet.title, (worksheet, []))[1].append(row)
+    for worksheet, shard_rows in shards.values():
+        prepare_for_write(worksheet)
+        if upsert_enabled():
+            upsert_rows(worksheet, shard_rows)
+        else:
+            append_rows(worksheet, shard_rows)
+    for row in rows:
+        queue_alerts(row)
+
+
+def submit(bodies):
+    """
+    Validates a list of submissions, saves the valid ones
+    together and assesses them.
+    Returns a (status, payload) pair per submission.
+    """
+    results = []
+    rows = []
+    for body in bodies:
+        try:
+            row = submission_row(body)
+        except ApiError as e:
+            results.append((e.status, e.payload))
+            continue
+        rows.append(row)
+        results.append(row)
+    if not rows:
+        return results
+    try:
+        save_rows(rows)
+    except Exception as e:
+        unavailable = (503, {"error": f"Storage unavailable: {e}"})
+        return [
+            result if isinstance(result, tuple) else unavailable
+            for result in results
+        ]
+    reference = get_reference()
+    return [
+        result if isinstance(result, tuple) else (201, {
+            "submission_id": result[SUBMISSION_ID_COLUMN - 1],
+            "assessments": assessments(result, reference)
+        })
+        for result in results
+    ]
+
+
+def submission(body, client):
+    """
+    Saves one metric submission for the logged in user.
+    """
+    status, payload = submit([body])[0]
+    if status >= 400:
+        raise ApiError(status, payload.pop("error"), **payload)
+    return status, payload
+
+
+ENDPOINTS = {
+    "/api/register": register,
+    "/api/login": login,
+    "/api/assessment": assessment,
+    "/api/submissions": submission,
+}
+
+
+def call(endpoint, body, client):
+    """
+    Runs one endpoint and returns (status, payload).
+    Sheet failures are answered with 503 so clients retry.
+    """
+    if not isinstance(body, dict):
+        return 400, {"error": "Request body must be a JSON object."}
+    try:
+        return ENDPOINTS[endpoint](body, client)
+    except ApiError as e:
+        return e.status, e.payload
+    except Exception as e:
+        return 503, {"error": f"Storage unavailable: {e}"}
+
+
+def batch(body, client):
+    """
+    Runs up to MAX_BATCH requests in order and returns a result
+    for each. Submissions in the batch are saved together with
+    one write per userdata shard, after the other requests.
+    """
+    requests = body.get("requests") if isinstance(body, dict) else None
+    if not isinstance(requests, list) or len(requests) > MAX_BATCH:
+        return 400, {
+            "error": f"requests must be a list of at most {MAX_BATCH}."
+        }
+    results = [None] * len(requests)
+    submissions = []
+    for index, item in enumerate(requests):
+        item = item if isinstance(item, dict) else {}
+        endpoint = item.get("path")
+        if endpoint == "/api/submissions":
+            submissions.append((index, item.get("body")))
+        elif endpoint in ENDPOINTS:
+            results[index] = call(endpoint, item.get("body"), client)
+        else:
+            results[index] = (404, {"error": "Unknown path."})
+    if submissions:
+        bodies = [
+            body if isinstance(body, dict) else {}
+            for _, body in submissions
+        ]
+        for (index, _), result in zip(submissions, submit(bodies)):
+            results[index] = result
+    return 200, {
+        "results": [
+            {"status": status, "body": payload}
+            for status, payload in results
+        ]
+    }
+
+
+def dump_periodically():
+    """
+    Merges this process's metrics into the shared database
+    every METRICS_INTERVAL seconds, as the server never exits
+    the way a terminal session does.
+    """
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        try:
+            dump_metrics()
+        except Exception:
+            pass
+
+
+def serve(host="127.0.0.1", port=8080, socket_path=None):
+    """
+    Serves the JSON API over HTTP on a TCP port or a Unix socket.
+    Each connection gets its own thread, while the sheet
+    clients, snapshot, reference curves and login limiter
+    stay warm in this one process.
+    The tenant is chosen with the X-Rehab-Tenant header.
+    http.server is imported here, as only the server needs it.
+    """
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ApiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            endpoint = self.path.split("?")[0]
+            started = time.perf_counter()
+            status, payload = self.handle_api(endpoint)
+            self.send_json(status, payload)
+            known = endpoint in ENDPOINTS or endpoint == "/api/batch"
+            label = endpoint if known else "other"
+            inc("rehab_api_requests_total", endpoint=label,
+                status=str(status))
+            observe("rehab_api_request_seconds",
+                    time.perf_counter() - started, endpoint=label)
+
+        def handle_api(self, endpoint):
+            if endpoint != "/api/batch" and endpoint not in ENDPOINTS:
+                self.close_connection = True
+                return 404, {"error": "Unknown path."}
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self.close_connection = True
+                return 400, {"error": "Invalid Content-Length."}
+            if length > MAX_BODY:
+                self.close_connection = True
+                return 413, {"error": "Request body too large."}
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return 400, {"error": "Request body must be JSON."}
+            try:
+                use_tenant(self.headers.get("X-Rehab-Tenant")
+                           or DEFAULT_TENANT)
+            except KeyError as e:
+                return 404, {"error": e.args[0]}
+            client = ""
+            if CLIENT_HEADER:
+                forwarded = self.headers.get(CLIENT_HEADER, "")
+                client = forwarded.split(",")[-1].strip()
+            # Unix socket peers have no address, so only those
+            # are limited per username alone
+            if not client and isinstance(self.client_address, tuple):
+                client = self.client_address[0]
+            if endpoint == "/api/batch":
+                return batch(body, client)
+            return call(endpoint, body, client)
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf8")
+            self.send_response(status)
+            if "retry_after" in payload:
+                self.send_header("Retry-After", str(payload["retry_after"]))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        class UnixApiServer(socketserver.ThreadingMixIn,
+                            socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        server = UnixApiServer(socket_path, ApiHandler)
+        print(f"Serving the API on unix:{socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), ApiHandler)
+        server.daemon_threads = True
+        print(f"Serving the API on http://{host}:{port}/api")
+    threading.Thread(target=dump_periodically, name="metrics-dump",
+                     daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        close_clients()
+        dump_metrics()
+
+
+def main(argv=None):
+    """
+    Command line entry point for the JSON API server.
+    """
+    parser = argparse.ArgumentParser(
+        description="Serve Rehab Metrics as a JSON API."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--socket", help="Serve on a Unix socket instead.")
+    options = parser.parse_args(argv)
+    serve(options.host, options.port, options.socket)
+
+
+if __name__ == "__main__":
+    main()
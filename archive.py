@@ -0,0 +1,218 @@
+# Standard library imports
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import date
+
+# Local application imports
+from reference import REFERENCE_FILE, get_reference_table, save_table
+from sharding import (
+    WRITE_BATCH,
+    get_userdata_worksheets,
+    open_or_create,
+    pause_writes,
+    resume_writes,
+    rewrite_rows
+)
+from sheet_reader import USERDATA_COLUMNS, iter_rows
+from sheets import current_tenant, get_spreadsheet, tenant_path, use_tenant
+from snapshot import reset as reset_snapshot
+from validation import (
+    MAX_TRACKING_DAYS,
+    ROM_BY_TEXT,
+    WEIGHT_BEARING_BY_TEXT,
+    parse_date
+)
+
+ARCHIVE_WORKSHEET = "userdata-archive"
+SUMMARY_WORKSHEET = "userdata-summary"
+
+SUMMARY_HEADERS = [
+    "Username", "Name", "Surgery Date", "Records", "First Day",
+    "Last Day", "Lowest Pain", "Highest Pain", "Best Range of motion",
+    "Best Weight Bearing", "Archived On"
+]
+
+
+def is_expired(row, today):
+    """
+    Checks if a userdata row is for a surgery past the
+    tracking window that parse_surgery_date enforces.
+    """
+    surgery_date = parse_date(row[2])
+    if surgery_date is None:
+        return False
+    return (today - surgery_date).days > MAX_TRACKING_DAYS
+
+
+def summarise(rows, today):
+    """
+    Builds the summary stats row kept for an archived user.
+    Rows are in the order they were submitted.
+    """
+    days = [int(row[3]) for row in rows if row[3].isdigit()]
+    pains = [int(row[5]) for row in rows if row[5].strip().isdigit()]
+    rom = max(
+        (row[6] for row in rows if row[6] in ROM_BY_TEXT),
+        key=ROM_BY_TEXT.get,
+        default=""
+    )
+    weight_bearing = max(
+        (row[7] for row in rows if row[7] in WEIGHT_BEARING_BY_TEXT),
+        key=WEIGHT_BEARING_BY_TEXT.get,
+        default=""
+    )
+    latest = rows[-1]
+    return [
+        latest[0], latest[1], latest[2], len(rows),
+        min(days, default=""), max(days, default=""),
+        min(pains, default=""), max(pains, default=""),
+        rom, weight_bearing, today.strftime("%d/%m/%Y")
+    ]
+
+
+def plan_compaction(rows, today):
+    """
+    Splits a shard's rows for compaction.
+    Users past the tracking window keep only their latest row;
+    all other rows stay in place, in their original order.
+    Returns (rows to keep, rows to archive, summary rows).
+    """
+    expired = {}
+    for row in rows:
+        if row[0] and is_expired(row, today):
+            expired.setdefault(row[0], []).append(row)
+    latest = {id(user_rows[-1]) for user_rows in expired.values()}
+    keep = []
+    archived = []
+    for row in rows:
+        if row[0] in expired and id(row) not in latest:
+            archived.append(row)
+        elif row[0]:
+            keep.append(row)
+    summaries = [
+        summarise(user_rows, today)
+        for user_rows in expired.values()
+        if len(user_rows) > 1
+    ]
+    return keep, archived, summaries
+
+
+def append_batched(worksheet, rows):
+    """
+    Appends rows in batches, one request per batch.
+    """
+    for start in range(0, len(rows), WRITE_BATCH):
+        worksheet.append_rows(rows[start:start + WRITE_BATCH])
+
+
+def archive_to_file(directory, rows):
+    """
+    Writes archived rows to a gzipped columnar JSON file,
+    one list of values per userdata column.
+    Returns the file path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory,
+        tenant_path(f"userdata-archive-{int(time.time())}.json.gz")
+    )
+    columns = {
+        name: [row[index] for row in rows]
+        for index, name in enumerate(USERDATA_COLUMNS)
+    }
+    with gzip.open(path, "wt", encoding="utf8") as archive_file:
+        json.dump(columns, archive_file)
+    return path
+
+
+def compact_shard(spreadsheet, worksheet, today, directory=None,
+                  dry_run=False):
+    """
+    Compacts one userdata worksheet.
+    Archived rows are written first, so a failure part way through
+    never loses data. Saves to the shard are then paused, and rows
+    appended since the first read are read again and kept at the
+    end when the live sheet is rewritten.
+    Returns (rows kept, rows archived), not counting those late rows.
+    """
+    rows = [row for _, row in iter_rows(worksheet, label="compaction")]
+    keep, archived, summaries = plan_compaction(rows, today)
+    if not archived or dry_run:
+        return len(keep), len(archived)
+    if directory:
+        print(f"Archived rows saved to {archive_to_file(directory, archived)}")
+    else:
+        append_batched(
+            open_or_create(spreadsheet, ARCHIVE_WORKSHEET), archived
+        )
+    append_batched(
+        open_or_create(spreadsheet, SUMMARY_WORKSHEET, SUMMARY_HEADERS),
+        summaries
+    )
+    pause_writes([worksheet])
+    try:
+        late = [
+            row for _, row in iter_rows(
+                worksheet, start_row=len(rows) + 2, label="compaction"
+            )
+        ]
+        rewrite_rows(worksheet, keep + late)
+    finally:
+        resume_writes([worksheet])
+    reset_snapshot(worksheet.title)
+    return len(keep), len(archived)
+
+
+def compact(today=None, directory=None, dry_run=False):
+    """
+    Compacts every userdata shard of the current tenant.
+    The reference curves are brought up to date first, so archived
+    rows stay in the cohort, then told how many rows each shard
+    holds afterwards.
+    Returns the total number of rows archived.
+    """
+    today = today or date.today()
+    tenant = current_tenant()
+    spreadsheet = get_spreadsheet(tenant)
+    worksheets = get_userdata_worksheets(tenant)
+    table = None if dry_run else get_reference_table(worksheets)
+    total = 0
+    for shard, worksheet in enumerate(worksheets):
+        kept, archived = compact_shard(
+            spreadsheet, worksheet, today, directory, dry_run
+        )
+        print(f"{worksheet.title}: kept {kept} rows, "
+              f"{'would archive' if dry_run else 'archived'} {archived}.")
+        if table is not None and archived:
+            table["rows_seen"][shard] = kept
+        total += archived
+    if table is not None and total:
+        save_table(table, tenant_path(REFERENCE_FILE))
+    return total
+
+
+def main(argv=None):
+    """
+    Command line job to archive rows past the tracking window.
+    Best run while clinics are closed, as the live sheet is
+    rewritten in place.
+    """
+    parser = argparse.ArgumentParser(
+        description="Archive userdata rows past the tracking window."
+    )
+    parser.add_argument("--tenant")
+    parser.add_argument("--local", metavar="DIR",
+                        help="Archive to a local file instead of a sheet.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report what would be archived.")
+    options = parser.parse_args(argv)
+    if options.tenant:
+        use_tenant(options.tenant)
+    compact(directory=options.local, dry_run=options.dry_run)
+
+
+if __name__ == "__main__":
+    main()
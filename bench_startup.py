@@ -0,0 +1,67 @@
+# Standard library imports
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Local application imports
+from loadgen import read_until
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds allowed from spawning run.py to the first prompt
+STARTUP_BUDGET = float(os.environ.get("REHAB_STARTUP_BUDGET", "0.5"))
+FIRST_PROMPT = "Are you a new user?"
+
+
+def time_to_first_prompt(timeout=10.0):
+    """
+    Spawns run.py in a pseudo terminal and times how long it
+    takes for the check_user_status prompt to appear.
+    Returns the time in seconds or None if it never appears.
+    """
+    master_fd, slave_fd = os.openpty()
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "run.py"],
+        stdin=slave_fd,
+        stdout=slave_fd,
+        stderr=slave_fd,
+        cwd=HERE,
+        close_fds=True
+    )
+    os.close(slave_fd)
+    output = {"text": "", "position": 0}
+    try:
+        found = read_until(
+            master_fd, output, FIRST_PROMPT, started + timeout
+        )
+        elapsed = time.monotonic() - started
+    finally:
+        process.kill()
+        process.wait()
+        os.close(master_fd)
+    return elapsed if found is not None else None
+
+
+def main(runs=5):
+    """
+    Measures startup over several runs and checks the median
+    against STARTUP_BUDGET. Exits with status 1 if over budget.
+    """
+    timings = [time_to_first_prompt() for _ in range(runs)]
+    if None in timings:
+        print("First prompt was not reached.")
+        sys.exit(1)
+    median = statistics.median(timings)
+    print(f"Startup to first prompt: median {median * 1000:.0f} ms, "
+          f"max {max(timings) * 1000:.0f} ms "
+          f"(budget {STARTUP_BUDGET * 1000:.0f} ms)")
+    if median > STARTUP_BUDGET:
+        print("Startup is over budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
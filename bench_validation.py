@@ -0,0 +1,74 @@
+# Standard library imports
+import timeit
+from datetime import datetime
+
+# Local application imports
+from validation import (
+    NOT_VALID,
+    parse_name,
+    parse_surgery_date
+)
+
+NAMES = ["David", "Jo", "averylongname", "bad name", "bob#1", "Maria99"]
+DATES = ["01/05/2026", "31/02/2026", "2026-05-01", "15/09/2026"]
+
+
+def legacy_validate_user(input_str):
+    """
+    Copy of the original loop over NOT_VALID, kept for comparison.
+    """
+    if len(input_str) < 2 or len(input_str) > 10:
+        return False, "length"
+    for char in NOT_VALID:
+        if char in input_str:
+            return False, "chars"
+    return True, ""
+
+
+def legacy_accept_date(date_str):
+    """
+    Copy of the original date handling, which parsed the date with
+    strptime in validate_date and again in process_new_user.
+    """
+    try:
+        surgery_date = datetime.strptime(date_str, "%d/%m/%Y")
+    except ValueError:
+        return False, 0
+    days_ago = (datetime.today() - surgery_date).days
+    if days_ago <= 0 or days_ago > 730:
+        return False, days_ago
+    surgery_date = datetime.strptime(date_str, "%d/%m/%Y").date()
+    return True, (datetime.today().date() - surgery_date).days
+
+
+def bench(label, func, values, number):
+    """
+    Times func over all values and prints microseconds per call.
+    """
+    seconds = timeit.timeit(
+        lambda: [func(value) for value in values], number=number
+    )
+    per_call = seconds / (number * len(values)) * 1e6
+    print(f"{label:<30} {per_call:8.3f} us/call")
+    return per_call
+
+
+def main(number=20000):
+    """
+    Benchmarks the validation module against the original functions.
+    """
+    print("-" * 50)
+    old = bench("legacy validate_user", legacy_validate_user, NAMES, number)
+    new = bench("validation.parse_name", parse_name, NAMES, number)
+    print(f"{'speedup':<30} {old / new:8.2f}x")
+    print("-" * 50)
+    old = bench("legacy date (2x strptime)", legacy_accept_date, DATES,
+                number)
+    new = bench("validation.parse_surgery_date", parse_surgery_date, DATES,
+                number)
+    print(f"{'speedup':<30} {old / new:8.2f}x")
+    print("-" * 50)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,285 @@
+# Standard library imports
+from collections import namedtuple
+from functools import lru_cache
+
+# Local application imports
+from validation import ROM_DEGREES
+
+# An assessment result. level is the answer code: the ROM or weight
+# bearing choice letter, or the pain level as an int
+Assessment = namedtuple(
+    "Assessment", ("metric", "band", "level", "message_id")
+)
+
+MESSAGES = {
+    "rom_poor_0_2": (
+        "Your ROM is poor for Week 0-2. "
+        "Consider consulting your healthcare provider."
+    ),
+    "rom_good_0_2": "Your ROM is good for Week 0-2.",
+    "rom_excellent_0_2": (
+        "Excellent progress! Your ROM is above expected "
+        "for Week 0-2."
+    ),
+    "rom_poor_2_6": (
+        "Your ROM is poor for Week 2-6. "
+        "Consider consulting your healthcare provider."
+    ),
+    "rom_functional_2_6": (
+        "Your ROM is functional but still needs work "
+        "for Week 2-6."
+    ),
+    "rom_excellent_2_6": (
+        "Excellent progress! Your ROM is above expected "
+        "for Week 2-6."
+    ),
+    "rom_poor_6_12": (
+        "Your ROM is poor for Week 6-12. "
+        "Consider consulting your healthcare provider."
+    ),
+    "rom_functional_6_12": (
+        "Your ROM is functional but still needs work "
+        "for Week 6-12."
+    ),
+    "rom_excellent_6_12": (
+        "Excellent progress! Your ROM is above expected "
+        "for Week 6-12."
+    ),
+    "rom_poor_12": (
+        "Your ROM is poor for Week 12+. "
+        "Consider consulting your healthcare provider."
+    ),
+    "rom_good_12": (
+        "Your ROM is good but can still improve "
+        "for Week 12+."
+    ),
+    "rom_optimal_12": (
+        "Excellent progress! Your ROM has reached "
+        "optimal levels for function."
+    ),
+    "rom_unknown": "Unable to assess ROM against timeline.",
+    "pain_high_0_2": (
+        "Your pain level is high for Week 0-2. This is normal "
+        "but monitor closely and consult your healthcare "
+        "provider if it worsens or suddenly increases."
+    ),
+    "pain_typical_0_2": (
+        "Your pain level is typical for Week 0-2. "
+        "Continue following your exercise plan."
+    ),
+    "pain_controlled_0_2": (
+        "Your pain level is well controlled for Week 0-2. "
+        "Excellent progress!"
+    ),
+    "pain_high_2_6": (
+        "Your pain level is higher than expected for Week 2-6. "
+        "Consider consulting your healthcare provider."
+    ),
+    "pain_typical_2_6": (
+        "Your pain level is typical for Week 2-6. "
+        "Continue your prescribed exercises."
+    ),
+    "pain_managed_2_6": (
+        "Your pain is well managed for Week 2-6. "
+        "Keep up the good work!"
+    ),
+    "pain_concerning_6_12": (
+        "Your pain level is concerning for Week 6-12. "
+        "Please consult your healthcare provider."
+    ),
+    "pain_typical_6_12": (
+        "Your pain level is typical for Week 6-12. "
+        "Continue your exercises."
+    ),
+    "pain_excellent_6_12": (
+        "Excellent pain level for Week 6-12. "
+        "Keep up with your exercises!"
+    ),
+    "pain_significant_12": (
+        "Your pain level is significantly elevated for Week 12+. "
+        "Please consult your healthcare provider."
+    ),
+    "pain_elevated_12": (
+        "Your pain level is elevated for Week 12+. "
+        "Consider consulting your healthcare provider."
+    ),
+    "pain_managed_12": (
+        "Excellent, your pain is well managed. "
+        "Keep doing your exercises to improve function."
+    ),
+    "pain_unknown": "Unable to assess pain level against timeline.",
+    "weight_bearing_poor_0_2": (
+        "Your weight bearing status is poor."
+        "Please consult your healthcare provider for guidance."
+    ),
+    "weight_bearing_expected_0_2": (
+        "Your weight bearing is expected. "
+        "Follow your healthcare provider's guidance for "
+        "progression."
+    ),
+    "weight_bearing_progressing_0_2": (
+        "Your weight bearing is progressing well. "
+        "Continue following your exercises."
+    ),
+    "weight_bearing_excellent_0_2": (
+        "Your weight bearing status is excellent "
+        "for this stage!"
+    ),
+    "weight_bearing_below_consult": (
+        "Your weight bearing is below expected. "
+        "Please consult your healthcare provider."
+    ),
+    "weight_bearing_below_continue": (
+        "Your weight bearing is below expected. "
+        "Please continue your exercises and consult your "
+        "healthcare provider if this worsens."
+    ),
+    "weight_bearing_excellent_2_6": (
+        "Excellent progress! Your weight bearing "
+        "is advancing well."
+    ),
+    "weight_bearing_lower_consult": (
+        "Your weight bearing is lower than "
+        "expected. Consider consulting your healthcare "
+        "provider."
+    ),
+    "weight_bearing_excellent_6_12": (
+        "Excellent! Your weight bearing status "
+        "is appropriate."
+    ),
+    "weight_bearing_full_12": (
+        "Excellent! You have achieved full "
+        "weight bearing status keep up the good work!."
+    ),
+    "weight_bearing_unknown": (
+        "Unable to assess weight bearing status: "
+        "Invalid data format"
+    ),
+}
+
+# Rules per metric and week band, as (highest score, message id)
+# pairs in order; a limit of None matches any higher score.
+# Scores are ROM degrees, pain levels and weight bearing levels 1-4
+RULES = {
+    "rom": {
+        "0-2": ((89, "rom_poor_0_2"), (90, "rom_good_0_2"),
+                (None, "rom_excellent_0_2")),
+        "2-6": ((90, "rom_poor_2_6"), (100, "rom_functional_2_6"),
+                (None, "rom_excellent_2_6")),
+        "6-12": ((90, "rom_poor_6_12"), (100, "rom_functional_6_12"),
+                 (None, "rom_excellent_6_12")),
+        "12+": ((99, "rom_poor_12"), (100, "rom_good_12"),
+                (None, "rom_optimal_12")),
+    },
+    "pain": {
+        "0-2": ((5, "pain_controlled_0_2"), (7, "pain_typical_0_2"),
+                (None, "pain_high_0_2")),
+        "2-6": ((4, "pain_managed_2_6"), (5, "pain_typical_2_6"),
+                (None, "pain_high_2_6")),
+        "6-12": ((4, "pain_excellent_6_12"), (5, "pain_typical_6_12"),
+                 (None, "pain_concerning_6_12")),
+        "12+": ((3, "pain_managed_12"), (4, "pain_elevated_12"),
+                (None, "pain_significant_12")),
+    },
+    "weight_bearing": {
+        "0-2": ((1, "weight_bearing_poor_0_2"),
+                (2, "weight_bearing_expected_0_2"),
+                (3, "weight_bearing_progressing_0_2"),
+                (None, "weight_bearing_excellent_0_2")),
+        "2-6": ((2, "weight_bearing_below_consult"),
+                (3, "weight_bearing_below_continue"),
+                (None, "weight_bearing_excellent_2_6")),
+        "6-12": ((2, "weight_bearing_lower_consult"),
+                 (3, "weight_bearing_below_continue"),
+                 (None, "weight_bearing_excellent_6_12")),
+        "12+": ((3, "weight_bearing_lower_consult"),
+                (None, "weight_bearing_full_12")),
+    },
+}
+
+# Weight bearing levels by choice code and by worksheet text
+WEIGHT_BEARING_LEVELS = {"a": 1, "b": 2, "c": 3, "d": 4}
+WB_LEVELS_BY_TEXT = {
+    "0-25% weight-bearing": 1,
+    "50-75% weight-bearing": 2,
+    "75%+ weight-bearing": 3,
+    "100% weight-bearing": 4
+}
+
+
+def week_band(metric, days_since_surgery):
+    """
+    Returns the week band an assessment uses for a number of days.
+    Weight bearing moves to the next band a week earlier.
+    """
+    weeks = days_since_surgery // 7
+    if metric == "weight_bearing":
+        weeks = max(weeks, 0) + 1
+    if weeks <= 2:
+        return "0-2"
+    if weeks <= 6:
+        return "2-6"
+    if weeks <= 12:
+        return "6-12"
+    return "12+"
+
+
+def rule_message(metric, band, score):
+    """
+    Returns the message id of the first rule that matches score.
+    """
+    for limit, message_id in RULES[metric][band]:
+        if limit is None or score <= limit:
+            return message_id
+
+
+def level_score(metric, level):
+    """
+    Converts an answer code into the score the rules compare.
+    """
+    if metric == "rom":
+        return ROM_DEGREES[level]
+    if metric == "weight_bearing":
+        return WEIGHT_BEARING_LEVELS[level]
+    return int(level)
+
+
+@lru_cache(maxsize=None)
+def assess(metric, band, level):
+    """
+    Assesses one answer code against a week band.
+    Results are immutable and depend only on the arguments,
+    so each one is worked out once per process.
+    Returns an Assessment.
+    """
+    try:
+        message_id = rule_message(metric, band, level_score(metric, level))
+    except (KeyError, TypeError, ValueError):
+        message_id = f"{metric}_unknown"
+    return Assessment(metric, band, level, message_id)
+
+
+def assess_metric(metric, level, days_since_surgery):
+    """
+    Assesses an answer code for a number of days since surgery.
+    Pain levels may be given as text.
+    Returns an Assessment.
+    """
+    if metric == "pain":
+        try:
+            level = int(level)
+        except (TypeError, ValueError):
+            level = None
+    return assess(metric, week_band(metric, days_since_surgery), level)
+
+
+def message_text(result):
+    """
+    Returns the message shown for an Assessment.
+    """
+    return MESSAGES[result.message_id]
+
+
 def get_rom_timeline_assessment(rom_degrees, choice, days_since_surgery):
     """
     Checks range of motion (ROM) based on weeks since surgery.
@@ -5,73 +287,10 @@ def get_rom_timeline_assessment(rom_degrees, choice, days_since_surgery):
     different choices.
     """
     try:
-        weeks = days_since_surgery // 7
-        user_rom = rom_degrees[choice]
-        if weeks <= 2:  # Week 0-2
-            if user_rom < 90:
-                return (
-                    "Your ROM is poor for Week 0-2. "
-                    "Consider consulting your healthcare provider."
-                )
-            elif user_rom == 90:
-                return (
-                    "Your ROM is good for Week 0-2."
-                )
-            else:
-                return (
-                    "Excellent progress! Your ROM is above expected "
-                    "for Week 0-2."
-                )
-        elif weeks <= 6:  # Week 2-6
-            if user_rom <= 90:
-                return (
-                    "Your ROM is poor for Week 2-6. "
-                    "Consider consulting your healthcare provider."
-                )
-            elif user_rom <= 100:
-                return (
-                    "Your ROM is functional but still needs work "
-                    "for Week 2-6."
-                )
-            else:
-                return (
-                    "Excellent progress! Your ROM is above expected "
-                    "for Week 2-6."
-                )
-        elif weeks <= 12:  # Week 6-12
-            if user_rom <= 90:
-                return (
-                    "Your ROM is poor for Week 6-12. "
-                    "Consider consulting your healthcare provider."
-                )
-            elif user_rom <= 100:
-                return (
-                    "Your ROM is functional but still needs work "
-                    "for Week 6-12."
-                )
-            else:
-                return (
-                    "Excellent progress! Your ROM is above expected "
-                    "for Week 6-12."
-                )
-        else:  # Week 12+
-            if user_rom <= 99:
-                return (
-                    "Your ROM is poor for Week 12+. "
-                    "Consider consulting your healthcare provider."
-                )
-            elif user_rom == 100:
-                return (
-                    "Your ROM is good but can still improve "
-                    "for Week 12+."
-                )
-            else:
-                return (
-                    "Excellent progress! Your ROM has reached "
-                    "optimal levels for function."
-                )
+        band = week_band("rom", days_since_surgery)
+        return MESSAGES[rule_message("rom", band, rom_degrees[choice])]
     except Exception:
-        return "Unable to assess ROM against timeline."
+        return MESSAGES["rom_unknown"]
 
 
 def get_pain_timeline_assessment(pain_level, days_since_surgery):
@@ -80,170 +299,22 @@ def get_pain_timeline_assessment(pain_level, days_since_surgery):
     Uses pain_level as the current pain value.
     """
     try:
-        weeks = days_since_surgery // 7
-        pain = int(pain_level)
-        if weeks > 12:  # Week 12+
-            if pain >= 5:
-                return (
-                    "Your pain level is significantly elevated for Week 12+. "
-                    "Please consult your healthcare provider."
-                )
-            elif pain == 4:
-                return (
-                    "Your pain level is elevated for Week 12+. "
-                    "Consider consulting your healthcare provider."
-                )
-            else:
-                return (
-                    "Excellent, your pain is well managed. "
-                    "Keep doing your exercises to improve function."
-                )
-        elif weeks <= 2:  # Week 0-2
-            if pain >= 8:
-                return (
-                    "Your pain level is high for Week 0-2. This is normal "
-                    "but monitor closely and consult your healthcare "
-                    "provider if it worsens or suddenly increases."
-                )
-            elif 6 <= pain <= 7:
-                return (
-                    "Your pain level is typical for Week 0-2. "
-                    "Continue following your exercise plan."
-                )
-            elif pain <= 5:
-                return (
-                    "Your pain level is well controlled for Week 0-2. "
-                    "Excellent progress!"
-                )
-        elif weeks <= 6:  # Week 2-6
-            if pain >= 6:
-                return (
-                    "Your pain level is higher than expected for Week 2-6. "
-                    "Consider consulting your healthcare provider."
-                )
-            elif pain == 5:
-                return (
-                    "Your pain level is typical for Week 2-6. "
-                    "Continue your prescribed exercises."
-                )
-            else:
-                return (
-                    "Your pain is well managed for Week 2-6. "
-                    "Keep up the good work!"
-                )
-        else:  # Week 6-12
-            if pain >= 6:
-                return (
-                    "Your pain level is concerning for Week 6-12. "
-                    "Please consult your healthcare provider."
-                )
-            elif pain == 5:
-                return (
-                    "Your pain level is typical for Week 6-12. "
-                    "Continue your exercises."
-                )
-            else:
-                return (
-                    "Excellent pain level for Week 6-12. "
-                    "Keep up with your exercises!"
-                )
+        band = week_band("pain", days_since_surgery)
+        return MESSAGES[rule_message("pain", band, int(pain_level))]
     except Exception:
-        return "Unable to assess pain level against timeline."
+        return MESSAGES["pain_unknown"]
 
 
 def get_weight_bearing_timeline_assessment(wb_status, days_since_surgery):
     """
     Checks weight bearing status based on weeks since surgery.
     Uses wb_status to describe the current weight bearing level.
-    Uses wb_levels dict to map weight bearing status strings to numbers.
     """
     try:
-        if days_since_surgery < 0:
-            days_since_surgery = 0
-        weeks = days_since_surgery // 7
-        wb_levels = {
-            "0-25% weight-bearing": 1,
-            "50-75% weight-bearing": 2,
-            "75%+ weight-bearing": 3,
-            "100% weight-bearing": 4
-        }
-        wb_level = wb_levels.get(wb_status)
+        wb_level = WB_LEVELS_BY_TEXT.get(wb_status)
         if wb_level is None:
-            return (
-                "Unable to assess weight bearing status: "
-                "Invalid data format"
-            )
-        if weeks < 2:  # Week 0-2
-            if wb_level == 1:
-                return (
-                    "Your weight bearing status is poor."
-                    "Please consult your healthcare provider for guidance."
-                )
-            elif wb_level == 2:
-                return (
-                    "Your weight bearing is expected. "
-                    "Follow your healthcare provider's guidance for "
-                    "progression."
-                )
-            elif wb_level == 3:
-                return (
-                    "Your weight bearing is progressing well. "
-                    "Continue following your exercises."
-                )
-            else:
-                return (
-                    "Your weight bearing status is excellent "
-                    "for this stage!"
-                )
-        elif weeks < 6:  # Week 2-6
-            if wb_level <= 2:
-                return (
-                    "Your weight bearing is below expected. "
-                    "Please consult your healthcare provider."
-                )
-            elif wb_level == 3:
-                return (
-                    "Your weight bearing is below expected. "
-                    "Please continue your exercises and consult your "
-                    "healthcare provider if this worsens."
-                )
-            else:
-                return (
-                    "Excellent progress! Your weight bearing "
-                    "is advancing well."
-                )
-        elif weeks < 12:  # Week 6-12
-            if wb_level <= 2:
-                return (
-                    "Your weight bearing is lower than "
-                    "expected. Consider consulting your healthcare "
-                    "provider."
-                )
-            elif wb_level == 3:
-                return (
-                    "Your weight bearing is below expected. "
-                    "Please continue your exercises and consult your "
-                    "healthcare provider if this worsens."
-                )
-            else:
-                return (
-                    "Excellent! Your weight bearing status "
-                    "is appropriate."
-                )
-        else:  # Week 12+
-            if wb_level <= 3:
-                return (
-                    "Your weight bearing is lower than "
-                    "expected. Consider consulting your healthcare "
-                    "provider."
-                )
-            else:
-                return (
-                    "Excellent! You have achieved full "
-                    "weight bearing status keep up the good work!."
-                )
+            return MESSAGES["weight_bearing_unknown"]
+        band = week_band("weight_bearing", days_since_surgery)
+        return MESSAGES[rule_message("weight_bearing", band, wb_level)]
     except Exception:
-        return (
-            "Unable to assess weight bearing status: "
-            "Invalid data format"
-        )
+        return MESSAGES["weight_bearing_unknown"]
@@ -0,0 +1,74 @@
+# Standard library imports
+import os
+import signal
+import threading
+import time
+
+# Seconds a single prompt may wait for an answer, and the most
+# a whole session may last; 0 turns a limit off.
+PROMPT_TIMEOUT = float(os.environ.get("REHAB_PROMPT_TIMEOUT", "300"))
+SESSION_TIMEOUT = float(os.environ.get("REHAB_SESSION_TIMEOUT", "1800"))
+
+SESSION = {"started": time.monotonic()}
+
+
+class IdleTimeout(BaseException):
+    """
+    Raised when a prompt or the session runs out of time.
+    Like KeyboardInterrupt it is not an Exception, so the
+    'except Exception' blocks around sheet calls let it through.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def start_session():
+    """
+    Starts the session clock.
+    """
+    SESSION["started"] = time.monotonic()
+
+
+def time_left():
+    """
+    Returns (seconds, reason) for the limit that ends first,
+    or (None, None) if neither limit is set.
+    """
+    limits = []
+    if PROMPT_TIMEOUT > 0:
+        limits.append((PROMPT_TIMEOUT, "prompt"))
+    if SESSION_TIMEOUT > 0:
+        elapsed = time.monotonic() - SESSION["started"]
+        limits.append((SESSION_TIMEOUT - elapsed, "session"))
+    return min(limits) if limits else (None, None)
+
+
+def ask(prompt="", read=input, **kwargs):
+    """
+    Reads an answer with read(prompt), which is input by default.
+    Raises IdleTimeout if no answer arrives in time.
+    A timer signal interrupts the blocking read, so limits only
+    apply on the main thread of platforms with setitimer.
+    """
+    seconds, reason = time_left()
+    usable = (
+        seconds is not None and hasattr(signal, "setitimer") and
+        threading.current_thread() is threading.main_thread()
+    )
+    if not usable:
+        return read(prompt, **kwargs)
+    if seconds <= 0:
+        raise IdleTimeout(reason)
+
+    def expire(signum, frame):
+        raise IdleTimeout(reason)
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return read(prompt, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
@@ -0,0 +1,56 @@
+# Standard library imports
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def profile_imports(module="run"):
+    """
+    Imports module in a fresh interpreter with -X importtime.
+    Returns (cumulative us, self us, module name) tuples,
+    slowest first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=HERE
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        timings.append((
+            int(parts[1]),
+            int(parts[0]),
+            parts[2].strip()
+        ))
+    timings.sort(reverse=True)
+    return timings
+
+
+def print_import_profile(module="run", top=20):
+    """
+    Prints the slowest imports of module, as surfaced by
+    python3 run.py --profile-imports.
+    """
+    timings = profile_imports(module)
+    total = next(
+        (cumulative for cumulative, _, name in timings if name == module), 0
+    )
+    print("-" * 50)
+    print(f"Import time for '{module}': {total / 1000:.1f} ms")
+    print("-" * 50)
+    print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+    for cumulative, own, name in timings[:top]:
+        print(f"{cumulative / 1000:13.1f} {own / 1000:8.1f}  {name}")
+    print("-" * 50)
+
+
+if __name__ == "__main__":
+    print_import_profile(*sys.argv[1:2])
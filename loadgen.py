@@ -0,0 +1,394 @@
+# Standard library imports
+import argparse
+import json
+import os
+import random
+import select
+import string
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Prompts printed by run.py, paired with the answer typed back.
+# Placeholders are filled in per session by fill_script.
+LOGIN_STEPS = [
+    ("Please enter (Y) for Yes or (N) for No:", "n"),
+    ("Please enter your username:", "{login_username}"),
+    ("Please enter your password:", "{login_password}"),
+]
+
+QUESTION_STEPS = [
+    ("What is your name?", "{name}"),
+    ("When did you have your surgery?", "{surgery_date}"),
+    ("Have you had any complications", "no"),
+    ("what is your current pain level?", "{pain}"),
+    ("How far can you currently bend your knee?", "{rom}"),
+    ("Weight bearing on operated leg?", "{wb}"),
+]
+
+REGISTER_STEPS = [
+    ("Please enter your username:", "{username}"),
+    ("Please enter a password", "{password}"),
+] + QUESTION_STEPS
+
+SCRIPTS = {
+    "new_user": (
+        [("Please enter (Y) for Yes or (N) for No:", "y")] + REGISTER_STEPS
+    ),
+    "returning_user": LOGIN_STEPS + [
+        ("Enter your choice (1-2):", "2"),
+    ],
+    "update": LOGIN_STEPS + [
+        ("Enter your choice (1-2):", "1"),
+    ] + QUESTION_STEPS,
+}
+
+# Output fragments used to classify a finished session
+QUOTA_MARKERS = ("429", "RESOURCE_EXHAUSTED", "Quota exceeded")
+ERROR_MARKERS = (
+    "An error occurred",
+    "Error ",
+    "Traceback",
+    "Incorrect username or password",
+)
+
+READ_SIZE = 4096
+
+
+def make_run_tag():
+    """
+    Creates a short random tag so usernames from
+    separate load runs do not collide.
+    """
+    return "".join(random.choices(string.ascii_lowercase, k=3))
+
+
+def base36(number):
+    """
+    Writes a session number in base 36.
+    """
+    digits = string.digits + string.ascii_lowercase
+    text = ""
+    while True:
+        number, digit = divmod(number, 36)
+        text = digits[digit] + text
+        if not number:
+            return text
+
+
+def needs_login(script):
+    """
+    Checks whether a script logs in to an existing account.
+    """
+    return any("{login_" in send for _, send in script)
+
+
+def fill_script(script, session_no, run_tag, login):
+    """
+    Replaces placeholders in a script with values for one session.
+    Usernames stay within the 10 character limit of validate_user,
+    so the session number is written in base 36 to keep each
+    registration username fresh.
+    Login steps use the given existing account.
+    Returns a new list of (expect, send) steps.
+    """
+    username = f"lg{run_tag}{base36(session_no)}"
+    surgery_date = datetime.today() - timedelta(
+        days=random.randint(1, 120)
+    )
+    values = {
+        "username": username,
+        "password": f"pw{run_tag}{session_no}x",
+        "name": "Loadtest",
+        "surgery_date": surgery_date.strftime("%d/%m/%Y"),
+        "pain": str(random.randint(0, 9)),
+        "rom": random.choice("abcde"),
+        "wb": random.choice("bcd"),
+        "login_username": login[0],
+        "login_password": login[1],
+    }
+    return [(expect, send.format(**values)) for expect, send in script]
+
+
+def load_scripts(path):
+    """
+    Loads recorded answer scripts from a JSON file.
+    The file maps a script name to a list of [expect, send] pairs.
+    Returns the built in scripts if no path is given.
+    """
+    if not path:
+        return SCRIPTS
+    with open(path, encoding="utf8") as scripts_file:
+        recorded = json.load(scripts_file)
+    return {
+        name: [tuple(step) for step in steps]
+        for name, steps in recorded.items()
+    }
+
+
+def read_until(master_fd, output, expect, deadline):
+    """
+    Reads from the pty until the expected text appears
+    after the current position or the deadline passes.
+    Returns the new search position or None on timeout/exit.
+    """
+    while True:
+        position = output["text"].find(expect, output["position"])
+        if position != -1:
+            output["position"] = position + len(expect)
+            return output["position"]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        ready, _, _ = select.select([master_fd], [], [], remaining)
+        if not ready:
+            return None
+        try:
+            chunk = os.read(master_fd, READ_SIZE)
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        output["text"] += chunk.decode("utf8", errors="replace")
+
+
+def drain(master_fd, output, process, deadline):
+    """
+    Collects any remaining output until the process exits.
+    """
+    while time.monotonic() < deadline:
+        ready, _, _ = select.select([master_fd], [], [], 0.1)
+        if ready:
+            try:
+                chunk = os.read(master_fd, READ_SIZE)
+            except OSError:
+                break
+            if not chunk:
+                break
+            output["text"] += chunk.decode("utf8", errors="replace")
+        elif process.poll() is not None:
+            break
+
+
+def classify_output(text, return_code, completed):
+    """
+    Works out the outcome of a session from its output.
+    Returns one of 'ok', 'quota', 'error' or 'timeout'.
+    """
+    if any(marker in text for marker in QUOTA_MARKERS):
+        return "quota"
+    if not completed:
+        return "timeout"
+    if return_code not in (0, None):
+        return "error"
+    if any(marker in text for marker in ERROR_MARKERS):
+        return "error"
+    return "ok"
+
+
+def run_session(steps, options):
+    """
+    Runs one run.py session inside a pseudo terminal,
+    the same way controllers/default.js spawns it.
+    Answers each prompt from the script in order.
+    Returns a dictionary describing the session outcome.
+    """
+    env = dict(os.environ)
+    if options.spreadsheet:
+        env["REHAB_METRICS_SPREADSHEET"] = options.spreadsheet
+    if options.tenant:
+        env["REHAB_TENANT"] = options.tenant
+    master_fd, slave_fd = os.openpty()
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, options.program],
+        stdin=slave_fd,
+        stdout=slave_fd,
+        stderr=slave_fd,
+        cwd=options.cwd,
+        env=env,
+        close_fds=True,
+    )
+    os.close(slave_fd)
+    output = {"text": "", "position": 0}
+    deadline = started + options.timeout
+    completed = True
+    try:
+        for expect, send in steps:
+            if read_until(master_fd, output, expect, deadline) is None:
+                completed = False
+                break
+            # Give the prompt time to switch terminal modes, as
+            # maskpass only enters raw mode once the prompt is shown
+            time.sleep(options.think_time)
+            os.write(master_fd, (send + "\r").encode("utf8"))
+        drain(master_fd, output, process, deadline)
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            completed = False
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        os.close(master_fd)
+    return {
+        "outcome": classify_output(
+            output["text"], process.returncode, completed
+        ),
+        "duration": time.monotonic() - started,
+    }
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction of a sorted list.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def summarise(results, elapsed):
+    """
+    Builds the load report from the session results.
+    """
+    outcomes = {"ok": 0, "error": 0, "quota": 0, "timeout": 0}
+    for result in results:
+        outcomes[result["outcome"]] += 1
+    durations = sorted(result["duration"] for result in results)
+    total = len(results)
+    return {
+        "sessions": total,
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_second": round(total / elapsed, 3) if elapsed else 0,
+        "outcomes": outcomes,
+        "error_rate": round(
+            (total - outcomes["ok"]) / total, 4
+        ) if total else 0,
+        "quota_hits": outcomes["quota"],
+        "duration_p50": round(percentile(durations, 0.5), 3),
+        "duration_p95": round(percentile(durations, 0.95), 3),
+        "duration_max": round(durations[-1], 3) if durations else 0,
+    }
+
+
+def print_report(report):
+    """
+    Prints the load report in a readable layout.
+    """
+    print("-" * 50)
+    print(f"Sessions:          {report['sessions']}")
+    print(f"Elapsed (s):       {report['elapsed_seconds']}")
+    print(f"Sessions/sec:      {report['sessions_per_second']}")
+    print(f"Error rate:        {report['error_rate']:.2%}")
+    print(f"Quota hits:        {report['quota_hits']}")
+    for outcome, count in report["outcomes"].items():
+        print(f"  {outcome:<16} {count}")
+    print(f"Duration p50 (s):  {report['duration_p50']}")
+    print(f"Duration p95 (s):  {report['duration_p95']}")
+    print(f"Duration max (s):  {report['duration_max']}")
+    print("-" * 50)
+
+
+def run_load(options):
+    """
+    Replays the chosen scripts across concurrent sessions.
+    Scripts are assigned to sessions in round robin order.
+    Returns the summary report.
+    """
+    scripts = load_scripts(options.scripts_file)
+    names = options.script or ["new_user"]
+    unknown = [name for name in names if name not in scripts]
+    if unknown:
+        raise SystemExit(f"Unknown script(s): {', '.join(unknown)}")
+    if not (options.login_username and options.login_password):
+        login_scripts = [
+            name for name in names if needs_login(scripts[name])
+        ]
+        if login_scripts:
+            raise SystemExit(
+                f"Script(s) {', '.join(login_scripts)} log in to an "
+                "existing account, pass --login-username and "
+                "--login-password for a registered user"
+            )
+    if options.sessions > 36 ** 5:
+        raise SystemExit("Too many sessions for unique usernames")
+    run_tag = make_run_tag()
+    login = (options.login_username, options.login_password)
+    session_steps = [
+        fill_script(scripts[names[number % len(names)]], number, run_tag,
+                    login)
+        for number in range(options.sessions)
+    ]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        results = list(executor.map(
+            lambda steps: run_session(steps, options), session_steps
+        ))
+    return summarise(results, time.monotonic() - started)
+
+
+def parse_args(argv=None):
+    """
+    Parses command line options for the load generator.
+    """
+    parser = argparse.ArgumentParser(
+        description="Replay scripted Rehab Metrics sessions concurrently."
+    )
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument(
+        "--script", action="append",
+        help="Script to replay, repeat to mix scripts (default new_user)."
+    )
+    parser.add_argument(
+        "--scripts-file",
+        help="JSON file of recorded scripts to use instead of built ins."
+    )
+    parser.add_argument(
+        "--spreadsheet",
+        help="Spreadsheet name to run against (REHAB_METRICS_SPREADSHEET)."
+    )
+    parser.add_argument(
+        "--tenant", help="Clinic tenant to run against (REHAB_TENANT)."
+    )
+    parser.add_argument(
+        "--login-username",
+        help="Registered user for the returning_user and update scripts."
+    )
+    parser.add_argument(
+        "--login-password", help="Password of the --login-username user."
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--think-time", type=float, default=0.1,
+        help="Seconds to wait after each prompt before answering."
+    )
+    parser.add_argument("--program", default="run.py")
+    parser.add_argument(
+        "--cwd", default=os.path.dirname(os.path.abspath(__file__))
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the report as JSON."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Load generator entry point.
+    """
+    options = parse_args(argv)
+    report = run_load(options)
+    if options.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
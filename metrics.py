@@ -0,0 +1,323 @@
+# Standard library imports
+import argparse
+import functools
+import os
+import sqlite3
+import threading
+import time
+
+# Each process merges its metrics into this SQLite file when it
+# exits, so the exporter can add them up across worker processes.
+# Metrics are only kept in memory when it is not set.
+METRICS_DB = os.environ.get("REHAB_METRICS_DB", "")
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+           60, 120, 300, 600, 1800)
+
+# Metric name: (type, help text)
+METRICS = {
+    "rehab_sessions_total": (
+        "counter", "Sessions finished, by outcome."
+    ),
+    "rehab_sessions_reaped_total": (
+        "counter", "Sessions closed for inactivity, by timeout reason."
+    ),
+    "rehab_session_seconds": (
+        "histogram", "Session duration in seconds."
+    ),
+    "rehab_call_seconds": (
+        "histogram", "Duration of instrumented calls in seconds."
+    ),
+    "rehab_call_errors_total": (
+        "counter", "Instrumented calls that raised an exception."
+    ),
+    "rehab_sheet_request_seconds": (
+        "histogram", "Duration of Sheets API requests in seconds."
+    ),
+    "rehab_sheet_requests_total": (
+        "counter", "Sheets API requests, by operation."
+    ),
+    "rehab_sheet_bytes_total": (
+        "counter", "Sheets API response bytes, by operation."
+    ),
+    "rehab_quota_errors_total": (
+        "counter", "Sheets API requests rejected for quota (HTTP 429)."
+    ),
+    "rehab_login_throttled_total": (
+        "counter", "Login attempts refused by the limiter, by scope."
+    ),
+    "rehab_api_requests_total": (
+        "counter", "JSON API requests, by endpoint and status."
+    ),
+    "rehab_api_request_seconds": (
+        "histogram", "JSON API request duration in seconds, by endpoint."
+    ),
+    "rehab_snapshot_lookups_total": (
+        "counter", "Local snapshot lookups, by result."
+    ),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, suffix)
+);
+"""
+
+REGISTRY = {}
+REGISTRY_LOCK = threading.Lock()
+
+
+def label_text(labels):
+    """
+    Renders labels in Prometheus form, sorted by name.
+    """
+    return ",".join(
+        f'{key}="{value}"' for key, value in sorted(labels.items())
+    )
+
+
+def inc(name, amount=1, **labels):
+    """
+    Adds amount to a counter.
+    """
+    key = (name, label_text(labels))
+    with REGISTRY_LOCK:
+        REGISTRY[key] = REGISTRY.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """
+    Records one value in a histogram.
+    Buckets are stored per bound and made cumulative on export.
+    """
+    key = (name, label_text(labels))
+    with REGISTRY_LOCK:
+        histogram = REGISTRY.get(key)
+        if histogram is None:
+            histogram = REGISTRY[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            index = len(BUCKETS)
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def timed(call):
+    """
+    Decorator recording how long a function takes,
+    and counting the calls that raise.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                inc("rehab_call_errors_total", call=call)
+                raise
+            finally:
+                observe("rehab_call_seconds", time.perf_counter() - start,
+                        call=call)
+        return wrapper
+    return decorator
+
+
+def samples(registry=None):
+    """
+    Flattens a registry, this process's by default, into
+    (name, labels, suffix, value) rows.
+    Histogram suffixes are 'bucket:<bound>', 'sum' and 'count'.
+    """
+    if registry is None:
+        with REGISTRY_LOCK:
+            registry = {
+                key: value if isinstance(value, (int, float))
+                else [list(value[0]), value[1], value[2]]
+                for key, value in REGISTRY.items()
+            }
+    rows = []
+    for (name, labels), value in registry.items():
+        if METRICS[name][0] == "counter":
+            rows.append((name, labels, "", value))
+            continue
+        buckets, total, count = value
+        for bound, bucket in zip(BUCKETS + ("+Inf",), buckets):
+            rows.append((name, labels, f"bucket:{bound}", bucket))
+        rows.append((name, labels, "sum", total))
+        rows.append((name, labels, "count", count))
+    return rows
+
+
+def connect(path):
+    """
+    Opens the shared metrics database.
+    """
+    connection = sqlite3.connect(path, timeout=5)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def dump(path=None):
+    """
+    Adds this process's metrics to the shared database
+    and clears them, so calling it twice never counts twice.
+    Does nothing unless REHAB_METRICS_DB or path is set.
+    """
+    global REGISTRY
+    path = path or METRICS_DB
+    if not path:
+        return
+    with REGISTRY_LOCK:
+        registry, REGISTRY = REGISTRY, {}
+    rows = samples(registry)
+    if not rows:
+        return
+    connection = connect(path)
+    try:
+        with connection:
+            connection.executemany(
+                "INSERT INTO samples VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name, labels, suffix) "
+                "DO UPDATE SET value = value + excluded.value",
+                rows
+            )
+    finally:
+        connection.close()
+
+
+def load(path=None):
+    """
+    Reads samples from the shared database, or from this
+    process when there is no database.
+    """
+    path = path or METRICS_DB
+    if not path:
+        return samples()
+    connection = connect(path)
+    try:
+        return connection.execute(
+            "SELECT name, labels, suffix, value FROM samples "
+            "ORDER BY name, labels"
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def series(name, labels):
+    """
+    Returns a series name with its labels, if it has any.
+    """
+    return f"{name}{{{labels}}}" if labels else name
+
+
+def number(value):
+    """
+    Formats a sample value, dropping '.0' from whole numbers.
+    """
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render(rows):
+    """
+    Renders samples in the Prometheus text exposition format.
+    """
+    by_name = {}
+    for name, labels, suffix, value in rows:
+        by_name.setdefault(name, {}).setdefault(labels, {})[suffix] = value
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = METRICS.get(name, ("untyped", ""))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, values in sorted(by_name[name].items()):
+            if kind != "histogram":
+                lines.append(f"{series(name, labels)} {number(values[''])}")
+                continue
+            prefix = f"{labels}," if labels else ""
+            running = 0
+            for bound in BUCKETS + ("+Inf",):
+                running += values.get(f"bucket:{bound}", 0)
+                lines.append(
+                    f'{name}_bucket{{{prefix}le="{bound}"}} {number(running)}'
+                )
+            lines.append(
+                f"{series(name + '_sum', labels)} {number(values['sum'])}"
+            )
+            lines.append(
+                f"{series(name + '_count', labels)} {number(values['count'])}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def serve(host="127.0.0.1", port=9464, socket_path=None, path=None):
+    """
+    Serves /metrics over HTTP on a TCP port or a Unix socket.
+    http.server is imported here, as only the exporter needs it.
+    """
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render(load(path)).encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type",
+                             "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = socketserver.UnixStreamServer(socket_path, MetricsHandler)
+        print(f"Serving metrics on unix:{socket_path}")
+    else:
+        server = HTTPServer((host, port), MetricsHandler)
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    """
+    Command line exporter for the shared metrics database.
+    """
+    parser = argparse.ArgumentParser(
+        description="Export Rehab Metrics worker metrics for Prometheus."
+    )
+    parser.add_argument("--db", default=METRICS_DB or "metrics.db",
+                        help="Shared metrics database.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9464)
+    parser.add_argument("--socket", help="Serve on a Unix socket instead.")
+    parser.add_argument("--once", action="store_true",
+                        help="Print the metrics once and exit.")
+    options = parser.parse_args(argv)
+    if options.once:
+        print(render(load(options.db)), end="")
+        return
+    serve(options.host, options.port, options.socket, options.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# Standard library imports
+import os
+import threading
+import time
+from array import array
+
+# Local application imports
+from sheet_reader import iter_records
+from sheets import tenant_path
+from validation import (
+    MAX_TRACKING_DAYS,
+    ROM_BY_TEXT,
+    ROM_DEGREES,
+    WEIGHT_BEARING_BY_TEXT,
+    WEIGHT_BEARING_CONVERSION
+)
+
+REFERENCE_FILE = os.environ.get("REHAB_REFERENCE_FILE", "reference.bin")
+# Seconds a saved table is used as it is before the userdata
+# shards are checked for new rows again, by any process
+REFERENCE_TTL = float(os.environ.get("REHAB_REFERENCE_TTL", "60"))
+DAYS = MAX_TRACKING_DAYS + 1
+
+# Each cohort answer counts towards days within this window either side
+WINDOW = 7
+# Counts added per cohort answer and per day of the prior curve
+COHORT_WEIGHT = 4
+PRIOR_WEIGHTS = (1, 2, 1)
+
+# Ordered answer codes for each metric, worst first
+ROM_CODES = tuple(sorted(ROM_DEGREES, key=ROM_DEGREES.get))
+WEIGHT_BEARING_CODES = tuple(sorted(WEIGHT_BEARING_CONVERSION))
+
+# Number of levels per metric; pain is stored as 10 - pain
+# so a higher level always means further along in recovery
+LEVELS = {
+    "rom": len(ROM_CODES),
+    "pain": 11,
+    "weight_bearing": len(WEIGHT_BEARING_CODES),
+}
+
+# (day, value) anchors of the expected recovery curves,
+# following the week bands used in guide.py
+ROM_ANCHORS = (
+    (0, ROM_DEGREES["b"]),
+    (14, ROM_DEGREES["c"]),
+    (42, ROM_DEGREES["d"]),
+    (84, ROM_DEGREES["e"]),
+)
+PAIN_ANCHORS = ((0, 7), (14, 6), (42, 5), (84, 3), (120, 2))
+WEIGHT_BEARING_ANCHORS = ((0, 2), (14, 2), (42, 3), (84, 4))
+
+
+def interpolate(anchors):
+    """
+    Builds a day-by-day array from (day, value) anchors,
+    joining the anchors with straight lines.
+    """
+    values = array("f", [0.0] * DAYS)
+    for day in range(DAYS):
+        for (start, low), (end, high) in zip(anchors, anchors[1:]):
+            if start <= day <= end:
+                fraction = (day - start) / (end - start)
+                values[day] = low + (high - low) * fraction
+                break
+        else:
+            values[day] = anchors[-1][1]
+    return values
+
+
+# Expected values per day since surgery
+EXPECTED = {
+    "rom": interpolate(ROM_ANCHORS),
+    "pain": interpolate(PAIN_ANCHORS),
+    "weight_bearing": interpolate(WEIGHT_BEARING_ANCHORS),
+}
+
+
+def expected_level(metric, day):
+    """
+    Converts the expected value for a day into a level index.
+    """
+    value = EXPECTED[metric][day]
+    if metric == "rom":
+        return min(
+            range(len(ROM_CODES)),
+            key=lambda index: abs(ROM_DEGREES[ROM_CODES[index]] - value)
+        )
+    if metric == "pain":
+        return 10 - int(round(value))
+    return int(round(value)) - 1
+
+
+def level_for(metric, value):
+    """
+    Returns the level index of an answer or None if unknown.
+    ROM and weight bearing accept codes or worksheet text.
+    """
+    if metric == "rom":
+        code = ROM_BY_TEXT.get(value, value)
+        return ROM_CODES.index(code) if code in ROM_CODES else None
+    if metric == "weight_bearing":
+        code = WEIGHT_BEARING_BY_TEXT.get(value, value)
+        if code in WEIGHT_BEARING_CODES:
+            return WEIGHT_BEARING_CODES.index(code)
+        return None
+    try:
+        pain = int(value)
+    except (TypeError, ValueError):
+        return None
+    return 10 - pain if 0 <= pain <= 10 else None
+
+
+def add_counts(table, metric, day, level, weight):
+    """
+    Adds weight to the histogram of every day within WINDOW of day.
+    """
+    levels = LEVELS[metric]
+    counts = table["counts"][metric]
+    for window_day in range(max(0, day - WINDOW),
+                            min(DAYS, day + WINDOW + 1)):
+        counts[window_day * levels + level] += weight
+
+
+def rebuild_cumulative(table, metric, first_day=0, last_day=DAYS - 1):
+    """
+    Recomputes the cumulative counts for a range of days,
+    so percentile lookups stay a single array read.
+    """
+    levels = LEVELS[metric]
+    counts = table["counts"][metric]
+    cumulative = table["cumulative"][metric]
+    for day in range(max(0, first_day), min(DAYS, last_day + 1)):
+        running = 0
+        base = day * levels
+        for level in range(levels):
+            cumulative[base + level] = running
+            running += counts[base + level]
+        table["totals"][metric][day] = running
+
+
+def build_table():
+    """
+    Builds a reference table holding only the expected curves.
+    Cohort answers are added with add_record.
+    """
+    table = {"rows_seen": [0], "counts": {}, "cumulative": {}, "totals": {}}
+    for metric, levels in LEVELS.items():
+        table["counts"][metric] = array("I", [0] * (DAYS * levels))
+        table["cumulative"][metric] = array("I", [0] * (DAYS * levels))
+        table["totals"][metric] = array("I", [0] * DAYS)
+        counts = table["counts"][metric]
+        for day in range(DAYS):
+            centre = expected_level(metric, day)
+            for offset, weight in zip((-1, 0, 1), PRIOR_WEIGHTS):
+                level = centre + offset
+                if 0 <= level < levels:
+                    counts[day * levels + level] += weight
+        rebuild_cumulative(table, metric)
+    return table
+
+
+def add_record(table, record):
+    """
+    Adds one userdata record to the cohort histograms and
+    recomputes only the days it affects.
+    Returns True if the record was used.
+    """
+    try:
+        day = int(record["days_since_surgery"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    if not 0 <= day < DAYS:
+        return False
+    answers = {
+        "rom": record.get("rom", ""),
+        "pain": record.get("pain_level", ""),
+        "weight_bearing": record.get("weight_bearing", ""),
+    }
+    for metric, value in answers.items():
+        level = level_for(metric, value)
+        if level is None:
+            continue
+        add_counts(table, metric, day, level, COHORT_WEIGHT)
+        rebuild_cumulative(table, metric, day - WINDOW, day + WINDOW)
+    return True
+
+
+def percentile(table, metric, day, level):
+    """
+    Places an answer on the cohort distribution for a day.
+    Returns the percentage of answers that are further behind,
+    counting half of equal answers.
+    """
+    day = min(max(day, 0), DAYS - 1)
+    index = day * LEVELS[metric] + level
+    total = table["totals"][metric][day]
+    if not total:
+        return None
+    below = table["cumulative"][metric][index]
+    same = table["counts"][metric][index]
+    return 100.0 * (below + same / 2) / total
+
+
+def refresh_table(table, worksheets):
+    """
+    Adds userdata rows appended since the table was last refreshed.
+    Only the new rows are read from each userdata shard.
+    """
+    rows_seen = table["rows_seen"]
+    rows_seen.extend([0] * (len(worksheets) - len(rows_seen)))
+    for shard, worksheet in enumerate(worksheets):
+        records = iter_records(
+            worksheet,
+            columns=(
+                "days_since_surgery", "pain_level", "rom", "weight_bearing"
+            ),
+            start_row=rows_seen[shard] + 2,
+            typed=True,
+            label="reference_refresh"
+        )
+        for _, record in records:
+            add_record(table, record)
+            rows_seen[shard] += 1
+    return table
+
+
+def save_table(table, path=REFERENCE_FILE):
+    """
+    Saves the histogram arrays in a compact binary file.
+    The file starts with the number of shards and the rows seen
+    in each. Cumulative counts are rebuilt on load.
+    The table is written to a temporary file and moved into place,
+    so other processes never read a partly written file.
+    """
+    rows_seen = table["rows_seen"]
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary, "wb") as reference_file:
+            array("I", [len(rows_seen), *rows_seen]).tofile(reference_file)
+            for metric in LEVELS:
+                table["counts"][metric].tofile(reference_file)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def load_table(path=REFERENCE_FILE, shards=1):
+    """
+    Loads a table saved by save_table.
+    Returns a fresh table if the file is missing or unreadable,
+    or was saved for a different number of shards.
+    """
+    table = build_table()
+    try:
+        with open(path, "rb") as reference_file:
+            rows_seen = array("I")
+            rows_seen.fromfile(reference_file, 1)
+            if rows_seen[0] != shards:
+                return table
+            rows_seen.fromfile(reference_file, shards)
+            counts = {}
+            for metric, levels in LEVELS.items():
+                counts[metric] = array("I")
+                counts[metric].fromfile(reference_file, DAYS * levels)
+    except (OSError, EOFError):
+        return table
+    table["rows_seen"] = list(rows_seen[1:])
+    table["counts"] = counts
+    for metric in LEVELS:
+        rebuild_cumulative(table, metric)
+    return table
+
+
+def checked_within(path, max_age):
+    """
+    Checks if the table file was saved or checked against the
+    userdata shards in the last max_age seconds.
+    """
+    try:
+        return time.time() - os.path.getmtime(path) < max_age
+    except OSError:
+        return False
+
+
+def get_reference_table(worksheets, path=None, max_age=None):
+    """
+    Loads the saved table, adds any rows newly appended to the
+    userdata worksheets and saves it again if anything changed.
+    With max_age, a table checked that recently by any process
+    is used without reading the shards; the file's modification
+    time records each check.
+    Each tenant keeps its own table file.
+    """
+    path = path or tenant_path(REFERENCE_FILE)
+    table = load_table(path, len(worksheets))
+    rows_seen = list(table["rows_seen"])
+    if max_age and any(rows_seen) and checked_within(path, max_age):
+        return table
+    refresh_table(table, worksheets)
+    try:
+        if table["rows_seen"] != rows_seen:
+            save_table(table, path)
+        elif os.path.exists(path):
+            os.utime(path)
+    except OSError:
+        pass
+    return table
+
+
+def placement_message(table, metric, day, value):
+    """
+    Describes where an answer sits against the reference curves.
+    Returns an empty string if the answer cannot be placed.
+    """
+    level = level_for(metric, value)
+    if table is None or level is None:
+        return ""
+    rank = percentile(table, metric, day, level)
+    if rank is None:
+        return ""
+    expected = EXPECTED[metric][min(max(day, 0), DAYS - 1)]
+    if metric == "rom":
+        expected_text = f"about {expected:.0f}° knee bend"
+    elif metric == "pain":
+        expected_text = f"pain around {expected:.0f}/10"
+    else:
+        expected_text = WEIGHT_BEARING_CONVERSION[
+            WEIGHT_BEARING_CODES[int(round(expected)) - 1]
+        ]
+    return (
+        f"\nOn day {day} you are ahead of {rank:.0f}% of the "
+        f"reference group (expected: {expected_text})."
+    )
@@ -0,0 +1,94 @@
+# Standard library imports
+import sys
+from functools import lru_cache
+
+# Third party imports
+from colorama import Fore, Style
+
+# Local application imports
+from guide import message_text
+
+SPACE = "\n"
+DASH = Fore.BLUE + "-" * 50
+CENTER_WIDTH = 50
+
+DISCLAIMER = Fore.YELLOW + (
+    "\nDISCLAIMER:\n"
+    "This tool is for educational and self-tracking purposes only.\n"
+    "It does not provide medical advice, diagnosis, or treatment.\n"
+    "If you are experiencing complications or severe symptoms,\n"
+    "please consult your healthcare professional.\n"
+) + Style.RESET_ALL
+
+PROFILE_FIELDS = (
+    ("Username", "username"),
+    ("Name", "name"),
+    ("Surgery Date", "surgery_date"),
+    ("Days Since Surgery", "days_since_surgery"),
+    ("Complications Reported", "complications"),
+    ("Pain Level (0-10)", "pain_level"),
+    ("Knee Range of Motion", "rom"),
+    ("Weight Bearing Status", "weight_bearing"),
+)
+
+ASSESSMENT_TITLES = {
+    "rom": "ROM Assessment",
+    "pain": "Pain Level Assessment",
+    "weight_bearing": "Weight Bearing Assessment",
+}
+
+
+def show(*blocks):
+    """
+    Writes a whole screen with a single write and flush.
+    Each block is followed by a newline, like a print call.
+    """
+    sys.stdout.write("".join(block + "\n" for block in blocks))
+    sys.stdout.flush()
+
+
+@lru_cache(maxsize=None)
+def banner(messages):
+    """
+    Builds a dashed banner with centred messages.
+    Messages must be a tuple so the result can be cached.
+    """
+    lines = [DASH, SPACE]
+    lines.extend(message.center(CENTER_WIDTH) for message in messages)
+    lines.extend([SPACE, DASH])
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=256)
+def assessment_block(title, assessment):
+    """
+    Builds the framed block shown for one assessment.
+    """
+    return "\n".join([
+        Fore.YELLOW + f"\n{title}:",
+        "-" * 50,
+        Fore.BLUE + assessment,
+        Fore.YELLOW + "-" * 50 + Style.RESET_ALL
+    ])
+
+
+def result_block(result, extra=""):
+    """
+    Builds the block shown for an Assessment result,
+    with any extra text added after its message.
+    """
+    return assessment_block(
+        ASSESSMENT_TITLES[result.metric], message_text(result) + extra
+    )
+
+
+def profile_block(metrics):
+    """
+    Builds the profile block from a metrics dictionary.
+    """
+    lines = [Fore.YELLOW + "\nYour Profile:", "-" * 50 + Style.RESET_ALL]
+    lines.extend(
+        f"{label}: {metrics[key]}" for label, key in PROFILE_FIELDS
+    )
+    lines.append(Fore.YELLOW + "-" * 50 + Style.RESET_ALL)
+    return "\n".join(lines)
@@ -1,91 +1,91 @@
 # Standard library imports
-from datetime import datetime
+import math
+import sys
+import time
 
 # Third party imports
-import gspread
-from google.oauth2.service_account import Credentials
+# gspread and google-auth are imported on first use in sheets.py
+# and maskpass inside the password prompts, to keep startup fast.
 from colorama import Fore, Style
-import maskpass
 
 # Local application imports
-from guide import (
-    get_rom_timeline_assessment,
-    get_pain_timeline_assessment,
-    get_weight_bearing_timeline_assessment
+from alerts import record_alerts
+from guide import assess_metric
+from idle import IdleTimeout, ask, start_session
+from metrics import dump as dump_metrics, inc, observe, timed
+from reference import REFERENCE_TTL, get_reference_table, placement_message
+from render import (
+    ASSESSMENT_TITLES,
+    DASH,
+    DISCLAIMER,
+    show,
+    banner,
+    profile_block,
+    result_block
 )
+from safe_writes import (
+    new_submission_id,
+    reserve_username,
+    release_username,
+    append_once,
+    append_username
+)
+from sharding import (
+    get_userdata_worksheet,
+    get_userdata_worksheets,
+    prepare_for_write
+)
+from sheet_reader import USERDATA_COLUMNS, has_header
+from sheets import (
+    WORKSHEET_USERS,
+    close_clients,
+    get_worksheet,
+    in_background
+)
+from snapshot import (
+    lookup_user,
+    lookup_metric_row,
+    reset as reset_snapshot,
+    store_row
+)
+from throttle import allow_login, login_succeeded
+from upsert import current_row, upsert_enabled, upsert_rows
+from validation import (
+    ROM_CONVERSION,
+    WEIGHT_BEARING_BY_TEXT,
+    WEIGHT_BEARING_CONVERSION,
+    parse_name,
+    parse_password,
+    parse_surgery_date,
+    parse_complications,
+    parse_pain_scale,
+    parse_rom,
+    parse_weight_bearing,
+    needs_safety_stop
+)
+from write_behind import WRITE_TIMEOUT, enqueue, flush
 
-# Required Google API scopes
-SCOPE = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-]
-
-# Load credentials from the service account
-CREDS = Credentials.from_service_account_file("creds.json")
-
-# Apply the necessary scopes to the credentials
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-
-# Authorise gspread with the scoped credentials
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-
-# Open the spreadsheet by name
-SPREADSHEET = GSPREAD_CLIENT.open("rehab_metrics")
-
-# Worksheet names
-WORKSHEET_USERS = "users"
-WORKSHEET_USERDATA = "userdata"
+# Column holding the submission id of each userdata row
+SUBMISSION_ID_COLUMN = USERDATA_COLUMNS.index("submission_id") + 1
 
-SPACE = "\n"
-DASH = Fore.BLUE + "-" * 50
-CENTER_WIDTH = 50
-NOT_VALID = (
-    '!', '?', '@', '*', '^', '.', '£', '$', '%', ',', '~', '`',
-    '+', '=', '<', '>', '|', '\\', '/', '[', ']', '{', '}', '#', ' '
+USERNAME_TAKEN = (
+    Fore.RED +
+    "This username already exists. Please choose another." +
+    Style.RESET_ALL
 )
 
-# ROM (Range of Motion) conversion
-ROM_CONVERSION = {
-    "a": "Less than 45°",
-    "b": "Less than 90°",
-    "c": "Approximately 90°",
-    "d": "Greater than 100°",
-    "e": "Greater than 120°",
-}
-
-ROM_DEGREES = {
-    "a": 45,
-    "b": 89,
-    "c": 90,
-    "d": 100,
-    "e": 120
-}
-
-# Weight Bearing conversion
-WEIGHT_BEARING_CONVERSION = {
-    "a": "0-25% weight-bearing",
-    "b": "50-75% weight-bearing",
-    "c": "75%+ weight-bearing",
-    "d": "100% weight-bearing"
-}
-
-DISCLAIMER = Fore.YELLOW + (
-    "\nDISCLAIMER:\n"
-    "This tool is for educational and self-tracking purposes only.\n"
-    "It does not provide medical advice, diagnosis, or treatment.\n"
-    "If you are experiencing complications or severe symptoms,\n"
-    "please consult your healthcare professional.\n"
-) + Style.RESET_ALL
-
 
 def welcome_user():
     """
     Displays welcome message and requests username input.
     Validates username and checks if it exists.
+    Reserves the username while the password is entered so
+    other sessions in this process cannot register it.
+    Whether the username already exists is checked in the
+    background while the password is typed.
     Handles password input and updates users worksheet.
     """
-    welcome_messages = [
+    welcome_messages = (
         "Welcome, new user!",
         "This tool has been developed to help you track",
         "your recovery after a knee replacement.",
@@ -97,19 +97,11 @@ def welcome_user():
         "To review your recovery progress in the future,",
         "you can log in using your username and password.",
         ""
-    ]
-
-    print(DASH)
-    print(SPACE)
-    for message in welcome_messages:
-        print(message.center(CENTER_WIDTH))
-    print(SPACE)
-    print(DASH)
-    print(DISCLAIMER)
+    )
 
-    print(DASH)
+    show(banner(welcome_messages), DISCLAIMER, DASH)
     while True:
-        user_name = input(Style.RESET_ALL + "Please enter your username:\n")
+        user_name = ask(Style.RESET_ALL + "Please enter your username:\n")
         user_name = user_name.strip()
         if user_quit(user_name):
             return None
@@ -117,16 +109,22 @@ def welcome_user():
         if not is_valid:
             print(Fore.RED + error_message + Style.RESET_ALL)
             continue
-        if check_existing_username(user_name):
-            print(Fore.RED +
-                  "This username already exists. " +
-                  "Please choose another." +
-                  Style.RESET_ALL)
+        token = reserve_username(user_name)
+        if token is None:
+            print(USERNAME_TAKEN)
             continue
-        password = user_password()
-        if password == "quit":
-            return None
-        update_user_worksheet(user_name, password)
+        taken = in_background(check_existing_username, user_name)
+        try:
+            password = user_password()
+            if password == "quit":
+                return None
+            if taken.result():
+                print(USERNAME_TAKEN)
+                continue
+            if not update_user_worksheet(user_name, password):
+                continue
+        finally:
+            release_username(user_name, token)
         print(f"\nHello, {user_name}! Please answer the following questions "
               f"so we can find out more about your recovery.")
         return user_name
@@ -138,20 +136,8 @@ def validate_user(input_str):
     Must be 2-10 characters long.
     Must not contain special characters or spaces.
     """
-    if len(input_str) < 2 or len(input_str) > 10:
-        return False, (
-            Fore.RED +
-            "Username must be between 2 and 10 characters." +
-            Style.RESET_ALL
-        )
-    for char in NOT_VALID:
-        if char in input_str:
-            return False, (
-                Fore.RED +
-                "Invalid name. Please avoid special characters and spaces." +
-                Style.RESET_ALL
-            )
-    return True, ""
+    is_valid, message, _ = parse_name(input_str)
+    return is_valid, message
 
 
 def user_password():
@@ -161,9 +147,11 @@ def user_password():
     Checks for minimum 6 characters length.
     Checks for presence of spaces.
     """
+    import maskpass
+
     while True:
-        password = maskpass.askpass("Please enter a password"
-                                    "(minimum 6 characters):\n", mask="*")
+        password = ask("Please enter a password"
+                       "(minimum 6 characters):\n", maskpass.askpass, mask="*")
         if user_quit(password):
             return "quit"
         is_valid_pass, pass_error = validate_password(password)
@@ -180,92 +168,32 @@ def validate_password(password):
     Ensures minimum 6 characters length.
     Checks for absence of spaces.
     """
-    if len(password) < 6:
-        return False, (
-            Fore.RED +
-            "Password must be at least 6 characters long." +
-            Style.RESET_ALL
-        )
-    if ' ' in password:
-        return False, (
-            Fore.RED +
-            "Password cannot contain spaces." +
-            Style.RESET_ALL
-        )
-    return True, ""
+    is_valid, message, _ = parse_password(password)
+    return is_valid, message
 
 
 def questions():
     """
-    Asks user a series of validated questions.
-    Updates worksheet with responses.
-    Returns valid answers or None if user quits.
+    Asks user each question in the QUESTIONS registry.
+    Each answer is parsed and validated once.
+    Returns parsed answers keyed by question id or None if user quits.
     """
     responses = {}
-    question_set = [
-        (
-            "What is your name?",
-            validate_user,
-            (Fore.RED +
-             "Invalid name, please enter a name between 2-10 characters." +
-             Style.RESET_ALL)
-        ),
-        (
-            "When did you have your surgery? (DD/MM/YYYY)",
-            validate_date,
-            (Fore.RED +
-             "Date must be in DD/MM/YYYY format and must be a valid date." +
-             Style.RESET_ALL)
-        ),
-        (
-            "Have you had any complications since your surgery? (Yes/No)",
-            validate_complications,
-            (Fore.RED +
-             "Please answer with 'Yes' or 'No'." +
-             Style.RESET_ALL)
-        ),
-        (
-            "On a scale of 0-10, what is your current pain level?\n"
-            "0 = No pain, 10 = Worst imaginable pain",
-            validate_pain_scale,
-            (Fore.RED +
-             "Please enter a number between 0 and 10." +
-             Style.RESET_ALL)
-        ),
-        (
-            "How far can you currently bend your knee?\n"
-            "A: I struggle to bend it and have minimal movement\n"
-            "B: I can bend it a little but my heel is in front\n"
-            "C: I can bend it so my heel is roughly in line\n"
-            "D: I can bend it well as my heel goes behind\n"
-            "E: The heel is a few inches behind the knee when i bend",
-            validate_rom,
-            "Please choose A, B, C, D or E."
-        ),
-        (
-            "Weight bearing on operated leg?\n"
-            "A: I struggle to put any weight\n"
-            "B: I can partially weight bear with aid\n"
-            "C: Most weight with aid but have limp\n"
-            "D: Full weight bearing without aids\n",
-            validate_weight_bearing,
-            "Please choose A, B, C or D."
-        )
-    ]
-    for question, validator, error_message in question_set:
+    for question_id, question, parser, error_message in QUESTIONS:
         while True:
-            answer = input(question + " ").strip()
+            answer = ask(question + " ").strip()
             if user_quit(answer):
                 return None
-            is_valid, validation_message = validator(answer)
+            is_valid, validation_message, value = parser(answer)
             if is_valid:
+                stop_if_unsafe(question_id, value)
                 msg = (
                     validation_message
                     if validation_message
                     else f"Your answer: {answer}"
                 )
                 print(f"{msg}\n")
-                responses[question] = answer
+                responses[question_id] = value
                 break
             else:
                 msg = (
@@ -277,160 +205,145 @@ def questions():
     return responses
 
 
-def calculate_days_since_surgery(date_str):
-    try:
-        surgery_date = datetime.strptime(date_str, "%d/%m/%Y")
-        today = datetime.today()
-        days_ago = (today - surgery_date).days
-        return True, days_ago
-    except ValueError:
-        return False, 0
-
-
-def validate_date(date_str):
-    """
-    Validates surgery date format and range.
-    Must be in DD/MM/YYYY format.
-    Cannot be in future or older than 2 years.
-    """
-    success, days_ago = calculate_days_since_surgery(date_str)
-    if not success:
-        return False, "Please enter your surgery date in DD/MM/YYYY format."
-    if days_ago <= 0:
-        return False, (
-            "The surgery date cannot be in the future.\n"
-            "If you've had your surgery today it may best "
-            "to use this tool tomorrow :)\n"
-            "Please check the date entered and try again."
-        )
-    if days_ago > 730:
-        return False, (
-            Fore.RED +
-            "Surgery date should be within 2 years for tracking. " +
-            "Please consult your healthcare provider." +
-            Style.RESET_ALL
-        )
-    return True, f"Surgery was {days_ago} days ago on {date_str}."
-
-
-def validate_complications(answer):
+def stop_if_unsafe(question_id, value):
     """
-    Validates complications response.
-    Accepts yes/no and variations (y/n, yep/nope).
-    Removes whitespace and converts to lowercase.
-    Exits program if 'y' response.
+    Exits the program with advice if a parsed answer
+    means the user should see a healthcare professional.
     """
-    answer = answer.lower().strip()
-    if answer in ("no", 'n', 'nope'):
-        return True, ""
-    if answer in ("yes", 'y', 'yep'):
+    if not needs_safety_stop(question_id, value):
+        return
+    if question_id == "complications":
         print("Before using this tool we recommend you seek advice "
               "from a healthcare professional. "
               "Take care!")
         exit()
-    return False, ""
-
-
-def validate_pain_scale(pain):
-    """
-    Validates pain scale input (0-10).
-    Exits with warning if pain level is 10.
-    Returns formatted pain level message.
-    """
-    try:
-        num = int(pain)
-        if 0 <= num <= 10:
-            if num == 10:
-                print(
-                    "Your pain level is 10/10. That sounds very uncomfortable "
-                    "and would recommend consulting a healthcare professional "
-                    "for advice."
-                )
-                print(
-                    "We recommend pausing the assessment for now. "
-                    "Take care.\n"
-                )
-                exit()
-            return True, f"Your pain level is {num}/10."
-        else:
-            return False, (
-                Fore.RED +
-                "Please enter a number between 0 and 10." +
-                Style.RESET_ALL
-            )
-    except ValueError:
-        return False, (
-            Fore.RED +
-            "Pain level must be a whole number" +
-            Style.RESET_ALL
+    if question_id == "pain":
+        print(
+            "Your pain level is 10/10. That sounds very uncomfortable "
+            "and would recommend consulting a healthcare professional "
+            "for advice."
         )
+    else:
+        print(
+            "This sounds very uncomfortable and would recommend "
+            "consulting a healthcare professional for advice."
+        )
+    print(
+        "We recommend pausing the assessment for now. "
+        "Take care.\n"
+    )
+    exit()
+
+
+# Question registry: (id, question text, parser, error message)
+# Parsers come from validation.py and return
+# (is_valid, message, parsed value).
+QUESTIONS = (
+    (
+        "name",
+        "What is your name?",
+        parse_name,
+        (Fore.RED +
+         "Invalid name, please enter a name between 2-10 characters." +
+         Style.RESET_ALL)
+    ),
+    (
+        "surgery_date",
+        "When did you have your surgery? (DD/MM/YYYY)",
+        parse_surgery_date,
+        (Fore.RED +
+         "Date must be in DD/MM/YYYY format and must be a valid date." +
+         Style.RESET_ALL)
+    ),
+    (
+        "complications",
+        "Have you had any complications since your surgery? (Yes/No)",
+        parse_complications,
+        (Fore.RED +
+         "Please answer with 'Yes' or 'No'." +
+         Style.RESET_ALL)
+    ),
+    (
+        "pain",
+        "On a scale of 0-10, what is your current pain level?\n"
+        "0 = No pain, 10 = Worst imaginable pain",
+        parse_pain_scale,
+        (Fore.RED +
+         "Please enter a number between 0 and 10." +
+         Style.RESET_ALL)
+    ),
+    (
+        "rom",
+        "How far can you currently bend your knee?\n"
+        "A: I struggle to bend it and have minimal movement\n"
+        "B: I can bend it a little but my heel is in front\n"
+        "C: I can bend it so my heel is roughly in line\n"
+        "D: I can bend it well as my heel goes behind\n"
+        "E: The heel is a few inches behind the knee when i bend",
+        parse_rom,
+        "Please choose A, B, C, D or E."
+    ),
+    (
+        "weight_bearing",
+        "Weight bearing on operated leg?\n"
+        "A: I struggle to put any weight\n"
+        "B: I can partially weight bear with aid\n"
+        "C: Most weight with aid but have limp\n"
+        "D: Full weight bearing without aids\n",
+        parse_weight_bearing,
+        "Please choose A, B, C or D."
+    )
+)
 
 
-def validate_rom(answer):
+def build_metric_row(username, responses):
     """
-    Validates range of motion (ROM) input.
-    Removes whitespace and converts to lowercase.
-    Checks if input matches valid options.
-    Returns True and prints message if valid.
-    Returns False and prompts for valid choice if invalid.
-    """
-    choice = answer.lower().strip()
-    if choice in ROM_CONVERSION:
-        base_message = f"Knee bend: {ROM_CONVERSION[choice]}"
-        return True, base_message
-    return False, (
-        Fore.RED +
-        "Please choose A, B, C, D or E." +
-        Style.RESET_ALL
-    )
+    Builds the userdata worksheet row from parsed answers.
+    Returns the row as a list in worksheet column order.
+    """
+    surgery_date, days_since_surgery = responses["surgery_date"]
+    return [
+        username,
+        responses["name"],
+        surgery_date.strftime("%d/%m/%Y"),
+        days_since_surgery,
+        "Yes" if responses["complications"] else "No",
+        str(responses["pain"]),
+        ROM_CONVERSION[responses["rom"]],
+        WEIGHT_BEARING_CONVERSION[responses["weight_bearing"]],
+        new_submission_id()
+    ]
 
 
-def validate_weight_bearing(answer):
+def load_reference():
     """
-    Validates weight bearing status input.
-    Returns tuple (is_valid, message).
-    Exits with warning if input is 'a'.
+    Loads the recovery reference curves for percentile placement.
+    The shards are only checked for new rows once the saved
+    table is REFERENCE_TTL seconds old.
+    Returns None if they cannot be loaded, so the assessments
+    are still shown without a percentile.
     """
-    if answer is None:
-        return False, "Please choose A, B, C or D."
-    selection = answer.lower().strip()
-    if selection in WEIGHT_BEARING_CONVERSION:
-        if selection == "a":
-            print(
-                "This sounds very uncomfortable and would recommend "
-                "consulting a healthcare professional for advice."
-            )
-            print(
-                "We recommend pausing the assessment for now. "
-                "Take care.\n"
-            )
-            exit()
-        base_message = (
-            f"{WEIGHT_BEARING_CONVERSION[selection]}"
+    try:
+        return get_reference_table(
+            get_userdata_worksheets(), max_age=REFERENCE_TTL
         )
-        return True, base_message
-    return False, (
-        Fore.RED +
-        "Please choose A, B, C or D.\n" +
-        Style.RESET_ALL
-    )
+    except Exception:
+        return None
 
 
 def assess_rom_progress(metric_data):
     """
     Assesses user's Range of Motion (ROM) progress.
-    Returns True if assessment is successful.
+    Returns an Assessment, with the rom_unknown message if the
+    ROM answer is not recognised, or None if days since surgery
+    are missing or the row cannot be read.
+    Nothing is printed, the caller shows the result.
     Converts ROM data to choice and days to integer.
     Uses conditional statements for ROM choice.
-    Includes error handling with try block.
     """
     try:
         if not metric_data[3]:
-            print(
-                "\nCannot perform ROM assessment: "
-                "Days since surgery not available"
-            )
-            return False
+            return None
         days_since_surgery = int(metric_data[3])
         rom_data = metric_data[6].split('\n')[0]
         rom_choice = None
@@ -444,137 +357,145 @@ def assess_rom_progress(metric_data):
             rom_choice = "d"
         elif "Greater than 120°" in rom_data:
             rom_choice = "e"
-        if rom_choice:
-            assessment = get_rom_timeline_assessment(
-                ROM_DEGREES,
-                rom_choice,
-                days_since_surgery
-            )
-            print(Fore.YELLOW + "\nROM Assessment:")
-            print("-" * 50)
-            print(Fore.BLUE + assessment)
-            print(Fore.YELLOW + "-" * 50 + Style.RESET_ALL)
-            return True
-        else:
-            print("\nUnable to determine ROM choice from data.")
-            return False
-    except Exception as e:
-        print(f"Error performing ROM assessment: {e}")
-        return False
+        return assess_metric("rom", rom_choice, days_since_surgery)
+    except Exception:
+        return None
 
 
 def assess_pain_progress(metric_data):
     """
     Assesses user's pain level progress.
-    Returns True if assessment is successful.
-    Checks days since surgery and pain level.
-    Uses get_pain_timeline_assessment for feedback.
+    Returns an Assessment, with the pain_unknown message if the
+    pain level is missing, or None if days since surgery are
+    missing or the row cannot be read.
+    Nothing is printed, the caller shows the result.
     """
     try:
         if not metric_data[3]:
-            print(
-                "\nCannot perform pain assessment: "
-                "Days since surgery not available"
-            )
-            return False
+            return None
         days_since_surgery = int(metric_data[3])
-        pain_level = metric_data[5]
-        if not pain_level:
-            print(
-                "\nCannot perform pain assessment: "
-                "Pain level data not available"
-            )
-            return False
-        assessment = get_pain_timeline_assessment(
-            pain_level,
-            days_since_surgery
-        )
-        print(Fore.YELLOW + "\nPain Level Assessment:")
-        print("-" * 50)
-        print(Fore.BLUE + assessment)
-        print(Fore.YELLOW + "-" * 50 + Style.RESET_ALL)
-        return True
-    except Exception as e:
-        print(f"Error performing pain assessment: {e}")
-        return False
+        return assess_metric("pain", metric_data[5], days_since_surgery)
+    except Exception:
+        return None
 
 
 def assess_weight_bearing_progress(metric_data):
     """
     Assesses user's weight bearing progress.
-    Returns True if assessment is successful.
-    Checks days since surgery and weight bearing status.
-    Uses get_weight_bearing_timeline_assessment.
+    Returns an Assessment, with the weight_bearing_unknown message
+    if the status is missing, or None if days since surgery are
+    missing or the row cannot be read.
+    Nothing is printed, the caller shows the result.
     """
     try:
         if not metric_data[3]:
-            print(
-                "\nCannot perform weight bearing assessment: "
-                "Days since surgery not available"
-            )
-            return False
+            return None
         days_since_surgery = int(metric_data[3])
         metrics = format_user_data(metric_data)
-        wb_status = metrics["weight_bearing"]
-        if not wb_status:
-            print(
-                "\nCannot perform weight bearing assessment: "
-                "Weight bearing status not available"
-            )
-            return False
-        assessment = get_weight_bearing_timeline_assessment(
-            wb_status,
+        return assess_metric(
+            "weight_bearing",
+            WEIGHT_BEARING_BY_TEXT.get(metrics["weight_bearing"]),
             days_since_surgery
         )
-        print(Fore.YELLOW + "\nWeight Bearing Assessment:")
-        print("-" * 50)
-        print(Fore.BLUE + assessment)
-        print(Fore.YELLOW + "-" * 50 + Style.RESET_ALL)
-        return True
-    except Exception as e:
-        print(f"Error performing weight bearing assessment: {e}")
-        return False
+    except Exception:
+        return None
 
 
-def update_rehab_metrics_worksheet(data):
+def show_assessments(metric_data, reference=None):
     """
-    This function updates the worksheet with user data.
-    It checks if the worksheet is empty.
-    If it is, it will add the headers.
-    It then appends the data to the worksheet.
-    A try block is used to catch any unexpected errors.
+    Assesses ROM, pain and weight bearing for a userdata row
+    and shows the results on one screen, each placed against
+    the reference curves when they are available.
+    A metric that could not be assessed is shown as such.
+    Returns the list of Assessment results.
+    """
+    results = [
+        assess_rom_progress(metric_data),
+        assess_pain_progress(metric_data),
+        assess_weight_bearing_progress(metric_data)
+    ]
+    blocks = [
+        result_block(result, placement_message(
+            reference, result.metric, int(metric_data[3]), result.level
+        )) if result else
+        f"\nCannot perform {ASSESSMENT_TITLES[metric]}: "
+        "the saved details are incomplete."
+        for metric, result in zip(ASSESSMENT_TITLES, results)
+    ]
+    show(*blocks)
+    return results
+
+
+@timed("save_metric_row")
+def save_metric_row(data, check_existing=False):
+    """
+    Saves a userdata row without printing anything,
+    so it can run on the background writer.
+    check_existing looks for the row before appending it,
+    for rows replayed from the write journal.
+    The row goes to the userdata shard for its username.
+    It checks if the worksheet has a header row.
+    If not, it will add the headers. While maintenance has
+    paused saves to the shard it waits, for a limited time.
+    It then appends the data to the worksheet once,
+    using the submission id to verify the write and
+    to avoid duplicate rows when an append is retried,
+    and adds it to the snapshot as the user's latest row.
+    In upsert mode the user's current row is updated in place
+    instead, with its earlier values moved to the history sheet.
+    Poor assessment results are queued as clinician alerts.
+    Raises an exception if the row could not be saved.
+    """
+    metric_worksheet = get_userdata_worksheet(data[0])
+    prepare_for_write(metric_worksheet, WRITE_TIMEOUT)
+    if upsert_enabled():
+        upsert_rows(metric_worksheet, [data])
+    else:
+        row_number = append_once(
+            metric_worksheet, data, SUBMISSION_ID_COLUMN, check_existing
+        )
+        store_row(metric_worksheet.title, row_number, data)
+    queue_alerts(data, check_existing)
+
+
+def queue_alerts(data, check_existing=False):
+    """
+    Stores poor assessment results for clinician review.
+    check_existing skips alerts already stored for a replayed row.
+    A failure here never stops the user's data being saved.
     """
     try:
-        metric_worksheet = SPREADSHEET.worksheet(WORKSHEET_USERDATA)
-        if not metric_worksheet.get_all_values():
-            headers = [
-                    "Username", "Name", "Surgery Date", "Days Since Surgery",
-                    "Complications", "Pain Level", "Range of motion",
-                    "Weight Bearing"
-                ]
-            metric_worksheet.append_row(headers)
-        metric_worksheet.append_row(data)
-        print("Updating your details...\n")
-        print("Your details have been updated successfully!\n")
+        record_alerts(data, data[SUBMISSION_ID_COLUMN - 1], check_existing)
     except Exception as e:
-        print(f"An error occurred while updating the worksheet: {e}")
+        print(f"Error recording alerts: {e}")
 
 
+@timed("update_user_worksheet")
 def update_user_worksheet(username, password):
     """
     This function updates the users worksheet with the
     username and password.
+    Returns False if another session registered the
+    username first or the update failed.
     A try block is used to catch any unexpected errors.
     """
     try:
-        user_worksheet = SPREADSHEET.worksheet(WORKSHEET_USERS)
-        if not user_worksheet.row_values(1):
-            headers = ["Username", "Password"]
+        user_worksheet = get_worksheet(WORKSHEET_USERS)
+        headers = ["Username", "Password"]
+        if not has_header(user_worksheet, len(headers)):
             user_worksheet.append_row(headers)
-        user_worksheet.append_row([username, password])
+        if not append_username(user_worksheet, username, password):
+            reset_snapshot(WORKSHEET_USERS)
+            print(Fore.RED +
+                  "This username was just taken. " +
+                  "Please choose another." +
+                  Style.RESET_ALL)
+            return False
         print("Username and password added successfully!\n")
+        return True
     except Exception as e:
         print(f"An error occurred while updating the users worksheet: {e}")
+        return False
 
 
 def check_user_status():
@@ -583,16 +504,11 @@ def check_user_status():
     Validates input to ensure only 'y' or 'n' is accepted.
     Returns True for new user, False for returning.
     """
-    print(DASH)
-    print(SPACE)
-    print("Welcome to Rehab Metrics!".center(CENTER_WIDTH))
-    print(SPACE)
-    print(DASH)
-    print(DISCLAIMER)
+    show(banner(("Welcome to Rehab Metrics!",)), DISCLAIMER)
     while True:
-        print(Fore.BLUE + "\nAre you a new user?" + Style.RESET_ALL)
-        status = input("Please enter (Y) for Yes "
-                       "or (N) for No:\n").strip().lower()
+        show(Fore.BLUE + "\nAre you a new user?" + Style.RESET_ALL)
+        status = ask("Please enter (Y) for Yes "
+                     "or (N) for No:\n").strip().lower()
         if status in ['y', 'n']:
             return status == 'y'
         print(Fore.RED + "Please enter only 'Y' for Yes "
@@ -602,13 +518,13 @@ def check_user_status():
 def check_existing_username(username):
     """
     Check if a username already exists in the users worksheet.
+    Uses the local snapshot, which only reads new rows on a miss.
     Returns True if username exists, False otherwise.
     A try block is used to catch any unexpected errors.
     """
     try:
-        user_worksheet = SPREADSHEET.worksheet(WORKSHEET_USERS)
-        usernames = user_worksheet.col_values(1)[1:]
-        return username in usernames
+        user_worksheet = get_worksheet(WORKSHEET_USERS)
+        return lookup_user(username, user_worksheet) is not None
     except Exception as e:
         print(f"Error checking username: {e}")
         return False
@@ -617,33 +533,34 @@ def check_existing_username(username):
 def get_user_row(username, worksheet):
     """
     Finds row number for username in worksheet.
-    Skips header row, starts at row 1.
+    Looks the username up in the local snapshot.
     Returns None if username not found.
     """
     try:
-        usernames = worksheet.col_values(1)
-        if len(usernames) <= 1:
-            print("No user data found.")
-            return None
-        for index in range(1, len(usernames)):
-            if usernames[index] == username:
-                return index + 1
-        return None
+        found = lookup_user(username, worksheet)
+        return found[0] if found else None
     except Exception as e:
         print(f"Error getting user row: {e}")
         return None
 
 
+@timed("get_user_metric_data")
 def get_user_metric_data(username, metric_worksheet):
     """
-    Retrieves the metric data for a given username.
-    Skips the header row and returns the matching entry.
+    Retrieves the metric data for a given username
+    from its userdata shard worksheet.
+    Looks the username up in the local snapshot, which reads
+    only rows appended since the last refresh on a miss.
+    In upsert mode the snapshot gives the row number and
+    only that row is read from the worksheet.
     Returns None if data is not found.
     """
-    all_metric_data = metric_worksheet.get_all_values()
-    for row in all_metric_data[1:]:
-        if row and row[0] == username:
-            return row
+    if upsert_enabled():
+        _, row = current_row(username, metric_worksheet)
+    else:
+        row = lookup_metric_row(username, metric_worksheet)
+    if row is not None:
+        return row
     print(f"No data found for {username}.")
     return None
 
@@ -683,17 +600,7 @@ def display_user_metrics(metrics):
     Uses metrics dictionary to print data.
     Includes all user profile and rehabilitation data.
     """
-    print(Fore.YELLOW + "\nYour Profile:")
-    print("-" * 50 + Style.RESET_ALL)
-    print(f"Username: {metrics['username']}")
-    print(f"Name: {metrics['name']}")
-    print(f"Surgery Date: {metrics['surgery_date']}")
-    print(f"Days Since Surgery: {metrics['days_since_surgery']}")
-    print(f"Complications Reported: {metrics['complications']}")
-    print(f"Pain Level (0-10): {metrics['pain_level']}")
-    print(f"Knee Range of Motion: {metrics['rom']}")
-    print(f"Weight Bearing Status: {metrics['weight_bearing']}")
-    print(Fore.YELLOW + "-" * 50 + Style.RESET_ALL)
+    show(profile_block(metrics))
 
 
 def get_user_data(username):
@@ -706,83 +613,114 @@ def get_user_data(username):
     A try block is used to catch any unexpected errors.
     """
     try:
-        user_worksheet = SPREADSHEET.worksheet(WORKSHEET_USERS)
+        user_worksheet = get_worksheet(WORKSHEET_USERS)
         username_row = get_user_row(username, user_worksheet)
         if username_row is None:
             print(f"Username '{username}' not found.")
             return False
-        metric_worksheet = SPREADSHEET.worksheet(WORKSHEET_USERDATA)
+        metric_worksheet = get_userdata_worksheet(username)
         metric_data = get_user_metric_data(username, metric_worksheet)
         if metric_data is None:
             print("No rehabilitation data found for this user.")
             return False
         metrics = format_user_data(metric_data)
         display_user_metrics(metrics)
-        assess_rom_progress(metric_data)
-        assess_pain_progress(metric_data)
-        assess_weight_bearing_progress(metric_data)
+        reference = load_reference()
+        show_assessments(metric_data, reference)
         return True
     except Exception as e:
         print(f"Error retrieving user data: {e}")
         return False
 
 
+@timed("verify_password")
 def verify_password(username, password):
     """
-    Connects to the users worksheet and checks if the username
-    is found in the worksheet.
-    Finds the index of the username and returns the password.
+    Checks if the username is found in the users snapshot,
+    refreshing it from the worksheet on a miss.
     Returns True if password matches the stored password.
     """
     try:
-        user_worksheet = SPREADSHEET.worksheet(WORKSHEET_USERS)
-        usernames = user_worksheet.col_values(1)
-        if username not in usernames:
+        user_worksheet = get_worksheet(WORKSHEET_USERS)
+        found = lookup_user(username, user_worksheet)
+        if found is None:
             return False
-        row_idx = usernames.index(username) + 1
-        stored_password = user_worksheet.cell(row_idx, 2).value
-        return password == stored_password.strip()
+        return password == found[1].strip()
     except Exception:
         print("Error verifying password")
         return False
 
 
+def prefetch_user(username):
+    """
+    Brings the snapshot up to date with a user's credentials
+    and metric rows, so the lookups after login are local.
+    The snapshot lock makes those lookups wait for a refresh
+    that is still running.
+    """
+    try:
+        lookup_user(username, get_worksheet(WORKSHEET_USERS))
+        lookup_metric_row(username, get_userdata_worksheet(username))
+    except Exception:
+        pass
+
+
 def handle_returning_user():
     """
     Handle the login process for returning users.
-    Returns True if login successful, False if user quits.
+    Returns the username if login successful, None if user quits.
     Checks if username and password are valid.
     Uses while loop to allow retry attempts.
     Maskpass hides the password.
+    Attempts are limited per username and per connection,
+    and refused locally before any sheet is read.
+    The user's records are fetched in the background while
+    the password is typed.
     """
+    import maskpass
+
     print(
         Fore.BLUE +
         "\nWelcome back! Please login to view your data." +
         Style.RESET_ALL
     )
     while True:
-        username = input("\nPlease enter your username:\n").strip()
+        username = ask("\nPlease enter your username:\n").strip()
         if user_quit(username):
-            return False
-        password = maskpass.askpass("Please enter your password:\n", mask="*")
-        if user_quit(password):
-            return False
-        print("Password entered.")
-        if verify_password(username, password):
-            if get_user_data(username):
-                return True
-        else:
+            return None
+        allowed, scope, wait = allow_login(username)
+        if not allowed:
+            inc("rehab_login_throttled_total", scope=scope)
             print(
                 Fore.RED +
-                "\nIncorrect username or password." +
+                "\nToo many login attempts. Please try again in "
+                f"{math.ceil(wait / 60)} minute(s)." +
                 Style.RESET_ALL
             )
-        retry = input(
+        else:
+            in_background(prefetch_user, username)
+            password = ask(
+                "Please enter your password:\n", maskpass.askpass, mask="*"
+            )
+            if user_quit(password):
+                return None
+            print("Password entered.")
+            if verify_password(username, password):
+                login_succeeded(username)
+                if get_user_data(username):
+                    return username
+            else:
+                print(
+                    Fore.RED +
+                    "\nIncorrect username or password." +
+                    Style.RESET_ALL
+                )
+        retry = ask(
             Fore.BLUE +
             "\nWould you like to try again? (Y/N):\n"
         ).lower()
         if retry != 'y':
-            return False
+            return None
 
 
 def user_quit(input_str):
@@ -802,88 +740,64 @@ def process_new_user():
     """
     Handles new user registration and data collection.
     Validates username and checks for duplicates.
-    Converts surgery date and calculates days.
-    Updates worksheet with collected data.
+    The answers are then collected by process_update.
     """
     username = welcome_user()
     if username is None:
         return
+    process_update(username)
+
+
+def process_update(username):
+    """
+    Collects a new set of answers for a registered user,
+    either just registered or logged in.
+    Builds the worksheet row from the parsed answers.
+    Queues the row for the background writer straight away,
+    so it is saved while the assessments are shown.
+    In upsert mode the row replaces the user's current row.
+    """
     responses = questions()
     if responses is None:
         return
-    surgery_date_str = responses.get(
-        "When did you have your surgery? (DD/MM/YYYY)",
-        ""
-    )
-    try:
-        surgery_date = datetime.strptime(
-            surgery_date_str,
-            "%d/%m/%Y"
-        ).date()
-    except ValueError:
-        print("Invalid surgery date format. Please use DD/MM/YYYY.")
-        return
-    current_date = datetime.today().date()
-    days_since_surgery = (current_date - surgery_date).days
-    rom_q = (
-        "How far can you currently bend your knee?\n"
-        "A: I struggle to bend it and have minimal movement\n"
-        "B: I can bend it a little but my heel is in front\n"
-        "C: I can bend it so my heel is roughly in line\n"
-        "D: I can bend it well as my heel goes behind\n"
-        "E: The heel is a few inches behind the knee when i bend"
-    )
-    wb_q = (
-        "Weight bearing on operated leg?\n"
-        "A: I struggle to put any weight\n"
-        "B: I can partially weight bear with aid\n"
-        "C: Most weight with aid but have limp\n"
-        "D: Full weight bearing without aids\n"
-    )
-    rom_valid, _ = validate_rom(responses.get(rom_q, ""))
-    wb_valid, _ = validate_weight_bearing(responses.get(wb_q, ""))
-    if not (rom_valid and wb_valid):
-        print("Invalid ROM or weight-bearing input. Please try again.")
-        return
-    rom = ROM_CONVERSION[responses.get(rom_q, "").lower().strip()]
-    wb = WEIGHT_BEARING_CONVERSION[responses.get(wb_q, "").lower().strip()]
-    complications_q = (
-        "Have you had any complications since your surgery? "
-        "(Yes/No)"
-    )
-    pain_q = (
-        "On a scale of 0-10, what is your current pain level?\n"
-        "0 = No pain, 10 = Worst imaginable pain"
-    )
-    data = [
-        username,
-        responses.get("What is your name?", ""),
-        surgery_date_str,
-        days_since_surgery,
-        responses.get(complications_q, ""),
-        responses.get(pain_q, ""),
-        rom,
-        wb
-    ]
-    assess_rom_progress(data)
-    assess_pain_progress(data)
-    assess_weight_bearing_progress(data)
-    update_rehab_metrics_worksheet(data)
+    data = build_metric_row(username, responses)
+    enqueue(save_metric_row, data)
+    reference = load_reference()
+    show_assessments(data, reference)
     quit_message()
 
 
+def finish_writes():
+    """
+    Waits, for a limited time, for queued rows to be saved
+    before the program exits, and reports the outcome.
+    Rows not saved in time are kept on this device and
+    uploaded by the next session.
+    """
+    saved, journaled, errors = flush()
+    for error in errors:
+        print(f"An error occurred while updating the worksheet: {error}")
+    if journaled:
+        print("Your details have been saved on this device "
+              "and will be uploaded next time.\n")
+    elif saved:
+        print("Your details have been updated successfully!\n")
+
+
 def display_update_options():
     """
     Displays available update options.
     Returns user's choice (1-2).
     Handles invalid input with error message.
     """
-    print(Fore.BLUE + "\nWould you like to update any of your data?")
-    print("Available options:")
-    print("1. Yes updates needed")
-    print("2. No updates needed")
+    show(
+        Fore.BLUE + "\nWould you like to update any of your data?",
+        "Available options:",
+        "1. Yes updates needed",
+        "2. No updates needed"
+    )
     while True:
-        choice = input("\nEnter your choice (1-2):\n").strip()
+        choice = ask("\nEnter your choice (1-2):\n").strip()
         if choice in ['1', '2']:
             return choice
         print(
@@ -898,17 +812,12 @@ def quit_message():
     Displays a farewell message when the user exits the program.
     Used when the user chooses not to update their data or quit.
     """
-    end_message = [
+    end_message = (
         "Thank you for using Rehab Metrics!",
         "We hope this tool has been beneficial.",
         "Come back soon!",
-    ]
-    print(DASH)
-    print(SPACE)
-    for message in end_message:
-        print(message.center(CENTER_WIDTH))
-    print(SPACE)
-    print(DASH)
+    )
+    show(banner(end_message))
 
 
 def main():
@@ -921,13 +830,41 @@ def main():
     if is_new_user:
         process_new_user()
     else:
-        login_successful = handle_returning_user()
-        if login_successful:
+        username = handle_returning_user()
+        if username:
             choice = display_update_options()
             if choice == '1':
-                process_new_user()
+                process_update(username)
             if choice == '2':
                 quit_message()
 
 
-main()
+if __name__ == "__main__":
+    if "--profile-imports" in sys.argv:
+        from import_profile import print_import_profile
+        print_import_profile()
+    else:
+        started = time.perf_counter()
+        start_session()
+        outcome = "error"
+        try:
+            main()
+            outcome = "completed"
+        except IdleTimeout as timeout:
+            outcome = "reaped"
+            inc("rehab_sessions_reaped_total", reason=timeout.reason)
+            print(Fore.YELLOW + "\nThis session was closed after a period "
+                  "of inactivity. Please start again when you are ready." +
+                  Style.RESET_ALL)
+        except SystemExit:
+            outcome = "stopped"
+            raise
+        except KeyboardInterrupt:
+            outcome = "interrupted"
+            raise
+        finally:
+            finish_writes()
+            close_clients()
+            inc("rehab_sessions_total", outcome=outcome)
+            observe("rehab_session_seconds", time.perf_counter() - started)
+            dump_metrics()
@@ -0,0 +1,165 @@
+# Standard library imports
+import re
+import threading
+import time
+import uuid
+
+# Local application imports
+from sheet_reader import iter_rows, read_cell, read_range
+
+# Usernames being registered by sessions in this process.
+# The lock only guards the dictionary, so sessions registering
+# different usernames never wait on each other.
+RESERVATIONS = {}
+RESERVATIONS_LOCK = threading.Lock()
+
+APPEND_RETRIES = 3
+RETRY_DELAY = 0.5
+UPDATED_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+def new_submission_id():
+    """
+    Creates a short unique id for one metric submission.
+    """
+    return uuid.uuid4().hex[:12]
+
+
+def reserve_username(username):
+    """
+    Reserves a username for the calling session.
+    Returns a token if the reservation was made,
+    or None if another session already holds it.
+    """
+    token = uuid.uuid4().hex
+    with RESERVATIONS_LOCK:
+        if username in RESERVATIONS:
+            return None
+        RESERVATIONS[username] = token
+    return token
+
+
+def release_username(username, token):
+    """
+    Releases a username reservation held with token.
+    """
+    with RESERVATIONS_LOCK:
+        if RESERVATIONS.get(username) == token:
+            del RESERVATIONS[username]
+
+
+def appended_row_number(response):
+    """
+    Reads the row number written by append_row from its response.
+    Returns None if the response does not include it.
+    """
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    match = UPDATED_RANGE_ROW.search(updated_range)
+    return int(match.group(1)) if match else None
+
+
+def find_value_row(worksheet, value, column):
+    """
+    Finds the first row holding value in the given column.
+    Reads only that column, page by page.
+    Returns the row number or None.
+    """
+    rows = iter_rows(worksheet, width=1, first_column=column, start_row=1,
+                     label="find_value")
+    for row_number, row in rows:
+        if row[0] == value:
+            return row_number
+    return None
+
+
+def append_once(worksheet, row, id_column, check_first=False):
+    """
+    Appends row so that it is written exactly once.
+    The value in id_column (1-based) identifies the row.
+    After each append the written cell is read back to verify it.
+    A retried append first checks if an earlier attempt already
+    landed, so retries never create duplicate rows.
+    check_first does the same before the first attempt, for rows
+    that an earlier process may already have written.
+    Returns the row number written.
+    """
+    row_id = row[id_column - 1]
+    error = None
+    for attempt in range(APPEND_RETRIES):
+        if attempt:
+            time.sleep(RETRY_DELAY * attempt)
+        if attempt or check_first:
+            existing = find_value_row(worksheet, row_id, id_column)
+            if existing is not None:
+                return existing
+        try:
+            response = worksheet.append_row(row)
+        except Exception as e:
+            error = e
+            continue
+        row_number = appended_row_number(response)
+        if row_number is not None:
+            written = read_cell(
+                worksheet, row_number, id_column, "append_verify"
+            )
+            if written == str(row_id):
+                return row_number
+    existing = find_value_row(worksheet, row_id, id_column)
+    if existing is not None:
+        return existing
+    raise error or RuntimeError("Append could not be verified.")
+
+
+def find_user_row(worksheet, username, password, after):
+    """
+    Finds the first row below after holding exactly this
+    username and password.
+    Returns the row number or None.
+    """
+    rows = iter_rows(worksheet, width=2, start_row=after + 1,
+                     label="find_user_row")
+    for row_number, row in rows:
+        if row == [username, password]:
+            return row_number
+    return None
+
+
+def remove_user_row(worksheet, username, password, row_number, first_row):
+    """
+    Deletes a losing registration's row.
+    Another losing session may have deleted a row above it since
+    it was appended, moving it up, so the row is read back first
+    and found again if it no longer holds this registration.
+    """
+    for _ in range(APPEND_RETRIES):
+        values = read_range(
+            worksheet, f"A{row_number}:B{row_number}", "verify_user_row"
+        )
+        if values and values[0][:2] == [username, password]:
+            worksheet.delete_rows(row_number)
+            return
+        row_number = find_user_row(worksheet, username, password, first_row)
+        if row_number is None:
+            return
+
+
+def append_username(worksheet, username, password):
+    """
+    Appends a new user and checks that no other process
+    registered the same username first.
+    If an earlier row holds the username, the new row is
+    removed again so only the first registration remains.
+    Returns True if this registration won.
+    """
+    response = worksheet.append_row([username, password])
+    row_number = appended_row_number(response)
+    if row_number is None:
+        return True
+    first_row = find_value_row(worksheet, username, 1)
+    if first_row is not None and first_row < row_number:
+        remove_user_row(worksheet, username, password, row_number, first_row)
+        return False
+    return True
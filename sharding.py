@@ -0,0 +1,271 @@
+# Standard library imports
+import argparse
+import csv
+import os
+import time
+import zlib
+
+# Local application imports
+from sheet_reader import USERDATA_COLUMNS, column_letter, iter_rows, read_range
+from sheets import (
+    WORKSHEET_USERDATA,
+    current_tenant,
+    get_spreadsheet,
+    get_tenant_worksheet,
+    load_tenants,
+    tenant_path,
+    use_tenant
+)
+from snapshot import reset as reset_snapshot
+
+# Number of userdata worksheets, 1 keeps the single 'userdata' sheet.
+# A tenant can override this with "userdata_shards" in its config.
+USERDATA_SHARDS = int(os.environ.get("REHAB_USERDATA_SHARDS", "1"))
+
+USERDATA_HEADERS = [
+    "Username", "Name", "Surgery Date", "Days Since Surgery",
+    "Complications", "Pain Level", "Range of motion",
+    "Weight Bearing", "Submission ID"
+]
+WRITE_BATCH = 500
+
+# Maintenance jobs pause writes to a shard by putting an expiry
+# time in this header row column, just past the headers, so the
+# header check before each save reads it at no extra cost.
+PAUSE_COLUMN = len(USERDATA_HEADERS) + 1
+# Seconds a pause lasts if the job stops without lifting it
+PAUSE_SECONDS = 300
+# Seconds a job waits after pausing, for saves that checked the
+# header just before the pause to finish
+PAUSE_GRACE = 10
+PAUSE_POLL = 2
+
+
+class WritesPaused(Exception):
+    """
+    Raised when a userdata shard stays paused for maintenance
+    longer than a save is willing to wait.
+    """
+
+
+def shard_count(tenant=None):
+    """
+    Returns the number of userdata shards for a tenant.
+    """
+    config = load_tenants()[tenant or current_tenant()]
+    return int(config.get("userdata_shards", USERDATA_SHARDS))
+
+
+def shard_names(shards):
+    """
+    Returns the worksheet names for a number of shards.
+    """
+    if shards <= 1:
+        return [WORKSHEET_USERDATA]
+    return [f"{WORKSHEET_USERDATA}-{index}" for index in range(shards)]
+
+
+def shard_index(username, shards):
+    """
+    Picks a shard from a stable hash of the username.
+    crc32 is used as Python's own hash changes between processes.
+    """
+    return zlib.crc32(username.encode("utf8")) % shards if shards > 1 else 0
+
+
+def userdata_worksheet_name(username, tenant=None):
+    """
+    Returns the name of the userdata worksheet holding username.
+    """
+    shards = shard_count(tenant)
+    return shard_names(shards)[shard_index(username, shards)]
+
+
+def get_userdata_worksheet(username, tenant=None):
+    """
+    Returns the userdata worksheet holding username.
+    """
+    tenant = tenant or current_tenant()
+    return get_tenant_worksheet(
+        tenant, userdata_worksheet_name(username, tenant)
+    )
+
+
+def get_userdata_worksheets(tenant=None):
+    """
+    Returns every userdata worksheet of a tenant, in shard order.
+    """
+    tenant = tenant or current_tenant()
+    return [
+        get_tenant_worksheet(tenant, name)
+        for name in shard_names(shard_count(tenant))
+    ]
+
+
+def open_or_create(spreadsheet, name, headers=USERDATA_HEADERS):
+    """
+    Returns a worksheet, adding it with a header row if missing.
+    """
+    import gspread
+
+    try:
+        return spreadsheet.worksheet(name)
+    except gspread.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(
+            name, rows=1000, cols=len(headers)
+        )
+        worksheet.append_row(headers)
+        return worksheet
+
+
+def paused_until(header):
+    """
+    Returns the time a shard's pause expires from its header row
+    values, or None if it is not paused.
+    """
+    try:
+        return float(header[PAUSE_COLUMN - 1])
+    except (IndexError, ValueError):
+        return None
+
+
+def prepare_for_write(worksheet, wait=0):
+    """
+    Makes sure a userdata shard has its header row and is not
+    paused for maintenance, from one read of the header row.
+    Waits up to wait seconds for a pause to be lifted.
+    Raises WritesPaused if it is not.
+    """
+    deadline = time.time() + wait
+    while True:
+        header = read_range(
+            worksheet, f"A1:{column_letter(PAUSE_COLUMN)}1", "header_check"
+        )
+        if not header:
+            worksheet.append_row(USERDATA_HEADERS)
+            return
+        until = paused_until(header[0])
+        now = time.time()
+        if until is None or until <= now:
+            return
+        if now >= deadline:
+            raise WritesPaused(
+                f"{worksheet.title} is paused for maintenance."
+            )
+        time.sleep(min(PAUSE_POLL, until - now, deadline - now))
+
+
+def pause_writes(worksheets):
+    """
+    Pauses saves to userdata shards for up to PAUSE_SECONDS,
+    then waits PAUSE_GRACE seconds for saves already under way.
+    """
+    for worksheet in worksheets:
+        fresh = worksheet.spreadsheet.worksheet(worksheet.title)
+        if fresh.col_count < PAUSE_COLUMN:
+            worksheet.add_cols(PAUSE_COLUMN - fresh.col_count)
+        worksheet.update(
+            f"{column_letter(PAUSE_COLUMN)}1",
+            [[time.time() + PAUSE_SECONDS]]
+        )
+    time.sleep(PAUSE_GRACE)
+
+
+def resume_writes(worksheets):
+    """
+    Lifts a pause set by pause_writes.
+    """
+    for worksheet in worksheets:
+        worksheet.batch_clear([f"{column_letter(PAUSE_COLUMN)}1"])
+
+
+def rewrite_rows(worksheet, rows):
+    """
+    Replaces everything below the header with rows,
+    using batched range updates.
+    The grid size is fetched fresh, as the worksheet's own
+    metadata may be older than rows appended since.
+    Saves must be paused while this runs, or rows appended
+    in the meantime are overwritten.
+    """
+    last = column_letter(len(USERDATA_COLUMNS))
+    row_count = worksheet.spreadsheet.worksheet(worksheet.title).row_count
+    worksheet.batch_clear([f"A2:{last}{max(row_count, 2)}"])
+    if len(rows) + 1 > row_count:
+        worksheet.add_rows(len(rows) + 1 - row_count)
+    for start in range(0, len(rows), WRITE_BATCH):
+        batch = rows[start:start + WRITE_BATCH]
+        first_row = start + 2
+        worksheet.update(
+            f"A{first_row}:{last}{first_row + len(batch) - 1}",
+            batch
+        )
+
+
+def rebalance(old_shards, new_shards, tenant=None):
+    """
+    Moves every userdata row into the worksheet its username
+    hashes to under new_shards.
+    Saves to the old shards are paused while it runs.
+    All rows are saved to a local CSV backup before any sheet is
+    changed. Row order within a user is kept, and the local
+    snapshots of the shards are reset.
+    Returns the number of rows moved.
+    """
+    tenant = tenant or current_tenant()
+    spreadsheet = get_spreadsheet(tenant)
+    old_worksheets = [
+        spreadsheet.worksheet(name) for name in shard_names(old_shards)
+    ]
+    pause_writes(old_worksheets)
+    try:
+        rows = []
+        for worksheet in old_worksheets:
+            rows.extend(
+                row for _, row in iter_rows(worksheet, label="rebalance")
+                if row[0]
+            )
+        backup = tenant_path(
+            f"userdata-backup-{int(time.time())}.csv", tenant
+        )
+        with open(backup, "w", newline="", encoding="utf8") as backup_file:
+            csv.writer(backup_file).writerows(rows)
+        grouped = {name: [] for name in shard_names(new_shards)}
+        new_names = shard_names(new_shards)
+        for row in rows:
+            grouped[new_names[shard_index(row[0], new_shards)]].append(row)
+        for name, shard_rows in grouped.items():
+            rewrite_rows(open_or_create(spreadsheet, name), shard_rows)
+        for worksheet in old_worksheets:
+            if worksheet.title not in grouped:
+                rewrite_rows(worksheet, [])
+    finally:
+        resume_writes(old_worksheets)
+    get_tenant_worksheet.cache_clear()
+    for name in set(shard_names(old_shards)) | set(grouped):
+        reset_snapshot(name)
+    print(f"Moved {len(rows)} rows into {new_shards} shard(s). "
+          f"Backup saved to {backup}.")
+    return len(rows)
+
+
+def main(argv=None):
+    """
+    Command line tool to rebalance userdata across shards.
+    Update REHAB_USERDATA_SHARDS (or the tenant config) to the new
+    count once it has finished.
+    """
+    parser = argparse.ArgumentParser(
+        description="Rebalance userdata rows across worksheet shards."
+    )
+    parser.add_argument("--tenant")
+    parser.add_argument("--from-shards", type=int)
+    parser.add_argument("--shards", type=int, required=True)
+    options = parser.parse_args(argv)
+    if options.tenant:
+        use_tenant(options.tenant)
+    rebalance(options.from_shards or shard_count(), options.shards)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Local application imports
+from sheets import operation
+from validation import ROM_BY_TEXT, WEIGHT_BEARING_BY_TEXT
+
+# Field names for the userdata worksheet columns, in order
+USERDATA_COLUMNS = (
+    "username",
+    "name",
+    "surgery_date",
+    "days_since_surgery",
+    "complications",
+    "pain_level",
+    "rom",
+    "weight_bearing",
+    "submission_id"
+)
+
+# Rows fetched per ranged read
+PAGE_SIZE = 200
+
+# Numbers come back as JSON numbers rather than display text,
+# while dates keep the text they were written with
+READ_OPTIONS = {
+    "value_render_option": "UNFORMATTED_VALUE",
+    "date_time_render_option": "FORMATTED_STRING",
+}
+
+
+def column_letter(index):
+    """
+    Converts a 1-based column index into its A1 letters.
+    """
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cell_text(value):
+    """
+    Converts an unformatted cell value back to the text
+    the rest of the program works with.
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def to_int(value):
+    """
+    Decodes a whole number cell, or returns None.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Typed decoding of userdata fields; others stay as text
+DECODERS = {
+    "days_since_surgery": to_int,
+    "pain_level": to_int,
+    "rom": ROM_BY_TEXT.get,
+    "weight_bearing": WEIGHT_BEARING_BY_TEXT.get,
+    "complications": lambda value: value == "Yes",
+}
+
+
+def read_range(worksheet, a1_range, label="read"):
+    """
+    Reads exactly one A1 range with unformatted values.
+    label names the operation in the bytes-per-operation metrics.
+    Returns a list of rows of text values.
+    """
+    with operation(label):
+        rows = worksheet.get(a1_range, **READ_OPTIONS)
+    return [[cell_text(value) for value in row] for row in rows]
+
+
+def read_cell(worksheet, row, column, label="read_cell"):
+    """
+    Reads a single cell as text, "" if it is empty.
+    """
+    letter = column_letter(column)
+    values = read_range(worksheet, f"{letter}{row}", label)
+    return values[0][0] if values and values[0] else ""
+
+
+def has_header(worksheet, width, label="header_check"):
+    """
+    Checks if the first row holds anything, reading only
+    the columns the worksheet uses.
+    """
+    return bool(read_range(worksheet, f"A1:{column_letter(width)}1", label))
+
+
+def iter_rows(worksheet, width=len(USERDATA_COLUMNS), first_column=1,
+              start_row=2, page_size=PAGE_SIZE, label="read_rows"):
+    """
+    Pages through a worksheet with fixed-size ranged reads.
+    Yields (row number, row values) tuples, one page in memory at a time.
+    Rows are padded to the requested width.
+    Stops after the first page that comes back short.
+    """
+    first = column_letter(first_column)
+    last = column_letter(first_column + width - 1)
+    while True:
+        end_row = start_row + page_size - 1
+        page = read_range(
+            worksheet, f"{first}{start_row}:{last}{end_row}", label
+        )
+        for offset, row in enumerate(page):
+            yield start_row + offset, row + [""] * (width - len(row))
+        if len(page) < page_size:
+            return
+        start_row = end_row + 1
+
+
+def iter_records(worksheet, columns=None, start_row=2, page_size=PAGE_SIZE,
+                 fields=USERDATA_COLUMNS, typed=False, label="read_records"):
+    """
+    Pages through a worksheet and yields parsed records.
+    Records are dictionaries keyed by field name.
+    Columns projects the read down to the named fields only,
+    so a lookup on usernames fetches a single column.
+    typed decodes days and pain to ints and ROM and weight
+    bearing to answer codes.
+    Yields (row number, record) tuples.
+    """
+    wanted = columns or fields
+    indexes = [fields.index(name) for name in wanted]
+    first_index = min(indexes)
+    width = max(indexes) - first_index + 1
+    rows = iter_rows(
+        worksheet,
+        width=width,
+        first_column=first_index + 1,
+        start_row=start_row,
+        page_size=page_size,
+        label=label
+    )
+    decoders = [
+        DECODERS.get(name) if typed else None for name in wanted
+    ]
+    for row_number, row in rows:
+        yield row_number, {
+            name: decode(row[index - first_index]) if decode
+            else row[index - first_index]
+            for name, index, decode in zip(wanted, indexes, decoders)
+        }
@@ -0,0 +1,262 @@
+# Standard library imports
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Local application imports
+from metrics import inc, observe
+
+# Required Google API scopes
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# Service account credentials file
+CREDS_FILE = "creds.json"
+
+# Spreadsheet name, can be overridden to point at another backend
+SPREADSHEET_NAME = os.environ.get("REHAB_METRICS_SPREADSHEET", "rehab_metrics")
+
+# Worksheet names
+WORKSHEET_USERS = "users"
+WORKSHEET_USERDATA = "userdata"
+
+# Tenants map a clinic to its own spreadsheet, given either as a JSON
+# file path or inline JSON, for example:
+# {"clinic-a": {"spreadsheet_id": "1AbC...", "creds": "clinic-a.json",
+#               "requests_per_minute": 60}}
+TENANTS_CONFIG = os.environ.get("REHAB_TENANTS", "")
+DEFAULT_TENANT = os.environ.get("REHAB_TENANT", "default")
+
+# Sheets API allows 60 requests per minute per user by default
+DEFAULT_REQUESTS_PER_MINUTE = 60
+
+# Threads used to fetch sheet data while the user is typing
+BACKGROUND_WORKERS = 4
+
+CURRENT = threading.local()
+OPEN_CLIENTS = []
+
+
+@lru_cache(maxsize=None)
+def load_tenants():
+    """
+    Reads the tenant configuration once per process.
+    The default tenant always exists and opens the spreadsheet
+    by name, or by key when REHAB_METRICS_SPREADSHEET_ID is set.
+    """
+    tenants = {}
+    if TENANTS_CONFIG:
+        if TENANTS_CONFIG.lstrip().startswith("{"):
+            tenants = json.loads(TENANTS_CONFIG)
+        else:
+            with open(TENANTS_CONFIG, encoding="utf8") as config_file:
+                tenants = json.load(config_file)
+    tenants.setdefault("default", {
+        "spreadsheet_name": SPREADSHEET_NAME,
+        "spreadsheet_id": os.environ.get("REHAB_METRICS_SPREADSHEET_ID", "")
+    })
+    return tenants
+
+
+def current_tenant():
+    """
+    Returns the tenant for the calling thread.
+    Falls back to REHAB_TENANT, or 'default'.
+    """
+    return getattr(CURRENT, "tenant", None) or DEFAULT_TENANT
+
+
+def use_tenant(tenant):
+    """
+    Routes sheet access from the calling thread to tenant.
+    """
+    if tenant not in load_tenants():
+        raise KeyError(f"Unknown tenant '{tenant}'")
+    CURRENT.tenant = tenant
+
+
+def tenant_path(filename, tenant=None):
+    """
+    Returns the local file name used by a tenant, so snapshots,
+    alerts and reference curves are never shared across clinics.
+    Only the file name is prefixed, so configured paths in
+    other directories keep working.
+    """
+    tenant = tenant or current_tenant()
+    if tenant == "default":
+        return filename
+    directory, name = os.path.split(filename)
+    return os.path.join(directory, f"{tenant}-{name}")
+
+
+@contextmanager
+def operation(name):
+    """
+    Labels the sheet requests made by the calling thread inside
+    the block, so bytes transferred are reported per operation.
+    """
+    previous = getattr(CURRENT, "operation", None)
+    CURRENT.operation = name
+    try:
+        yield
+    finally:
+        CURRENT.operation = previous
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(tenant):
+    """
+    Creates the token bucket that spaces out one tenant's requests.
+    """
+    rate = load_tenants()[tenant].get(
+        "requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE
+    )
+    return {
+        "rate": rate / 60.0,
+        "capacity": float(rate),
+        "tokens": float(rate),
+        "updated": time.monotonic(),
+        "lock": threading.Lock()
+    }
+
+
+def acquire(limiter):
+    """
+    Takes one token from the bucket, sleeping until one is free.
+    """
+    while True:
+        with limiter["lock"]:
+            now = time.monotonic()
+            limiter["tokens"] = min(
+                limiter["capacity"],
+                limiter["tokens"] + (now - limiter["updated"]) *
+                limiter["rate"]
+            )
+            limiter["updated"] = now
+            if limiter["tokens"] >= 1:
+                limiter["tokens"] -= 1
+                return
+            wait = (1 - limiter["tokens"]) / limiter["rate"]
+        time.sleep(wait)
+
+
+@lru_cache(maxsize=None)
+def get_client(tenant="default"):
+    """
+    Authorises gspread with the tenant's scoped service account
+    credentials. Every request made through the client first takes
+    a token from the tenant's rate limiter, and is timed and
+    counted in the metrics registry, with the response bytes
+    reported per operation.
+    gspread and google-auth are imported here rather than at the
+    top of the module, so sessions that never reach the sheets
+    do not pay for importing them.
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    config = load_tenants()[tenant]
+    creds = Credentials.from_service_account_file(
+        config.get("creds", CREDS_FILE)
+    )
+    client = gspread.authorize(creds.with_scopes(SCOPE))
+    limiter = get_rate_limiter(tenant)
+    request = client.request
+
+    def limited_request(*args, **kwargs):
+        acquire(limiter)
+        start = time.perf_counter()
+        label = getattr(CURRENT, "operation", None) or "other"
+        try:
+            response = request(*args, **kwargs)
+            inc("rehab_sheet_requests_total", operation=label)
+            inc("rehab_sheet_bytes_total", len(response.content),
+                operation=label)
+            return response
+        except gspread.exceptions.APIError as e:
+            if e.response.status_code == 429:
+                inc("rehab_quota_errors_total")
+            raise
+        finally:
+            observe("rehab_sheet_request_seconds",
+                    time.perf_counter() - start)
+
+    client.request = limited_request
+    OPEN_CLIENTS.append(client)
+    return client
+
+
+def close_clients():
+    """
+    Closes the HTTP sessions of every client opened by this
+    process and stops the background pool without waiting.
+    """
+    for client in OPEN_CLIENTS:
+        try:
+            client.session.close()
+        except Exception:
+            pass
+    if get_background_pool.cache_info().currsize:
+        get_background_pool().shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=None)
+def get_spreadsheet(tenant="default"):
+    """
+    Opens the tenant's spreadsheet on first use.
+    Opening by key skips the Drive search that opening by name needs.
+    """
+    config = load_tenants()[tenant]
+    client = get_client(tenant)
+    if config.get("spreadsheet_id"):
+        return client.open_by_key(config["spreadsheet_id"])
+    return client.open(config.get("spreadsheet_name", SPREADSHEET_NAME))
+
+
+@lru_cache(maxsize=None)
+def get_tenant_worksheet(tenant, name):
+    """
+    Returns a tenant's worksheet, fetching its metadata only once.
+    """
+    return get_spreadsheet(tenant).worksheet(name)
+
+
+def get_worksheet(name):
+    """
+    Returns a worksheet of the current tenant's spreadsheet.
+    """
+    return get_tenant_worksheet(current_tenant(), name)
+
+
+@lru_cache(maxsize=None)
+def get_background_pool():
+    """
+    Creates the thread pool for background sheet reads on first use.
+    concurrent.futures is imported here to keep startup fast.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(
+        max_workers=BACKGROUND_WORKERS, thread_name_prefix="sheets"
+    )
+
+
+def in_background(function, *args):
+    """
+    Runs function on the background pool, routed to the calling
+    thread's tenant.
+    Returns a Future for its result.
+    """
+    tenant = current_tenant()
+
+    def run_for_tenant():
+        use_tenant(tenant)
+        return function(*args)
+
+    return get_background_pool().submit(run_for_tenant)
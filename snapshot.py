@@ -0,0 +1,275 @@
+# Standard library imports
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+# Local application imports
+from metrics import inc
+from sheet_reader import USERDATA_COLUMNS, iter_rows
+from sheets import tenant_path
+
+SNAPSHOT_FILE = os.environ.get("REHAB_SNAPSHOT_FILE", "snapshot.db")
+# Bytes of the snapshot file SQLite may read through a memory map
+SNAPSHOT_MMAP_SIZE = 64 * 1024 * 1024
+
+USERS_COLUMNS = ("username", "password")
+# Columns that identify the last row seen, checked before each
+# refresh to catch worksheets rewritten by another host
+MARKER_COLUMNS = {"users": ("username",)}
+USERDATA_MARKER_COLUMNS = ("username", "submission_id")
+# SNAPSHOT_LOCK guards the shared connection and is only held for
+# SQLite work. Each worksheet also has a lock of its own, held while
+# its snapshot is refreshed over the network or changed, so a slow
+# read of one sheet never holds up lookups in another.
+SNAPSHOT_LOCK = threading.Lock()
+SHEET_LOCKS = {}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS revision (
+    sheet TEXT PRIMARY KEY,
+    last_row INTEGER NOT NULL,
+    refreshed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    row INTEGER PRIMARY KEY,
+    {", ".join(f"{name} TEXT" for name in USERS_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS users_by_username ON users (username);
+"""
+
+# Each userdata shard worksheet gets a table of its own
+USERDATA_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {{table}} (
+    row INTEGER PRIMARY KEY,
+    {", ".join(f"{name} TEXT" for name in USERDATA_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS {{table}}_by_username ON {{table}} (username);
+"""
+
+
+def get_connection(path=None):
+    """
+    Returns the snapshot connection for path,
+    or for the current tenant's snapshot file.
+    """
+    return open_snapshot(path or tenant_path(SNAPSHOT_FILE))
+
+
+@lru_cache(maxsize=None)
+def open_snapshot(path):
+    """
+    Opens a snapshot file once per process.
+    The file is read through a memory map, so a warm process
+    answers lookups straight from the page cache.
+    """
+    connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    connection.execute(f"PRAGMA mmap_size = {SNAPSHOT_MMAP_SIZE}")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def table_name(connection, sheet):
+    """
+    Returns the snapshot table for a worksheet name,
+    creating it for userdata shards seen for the first time.
+    """
+    if sheet == "users":
+        return sheet
+    table = sheet.replace("-", "_")
+    connection.executescript(USERDATA_SCHEMA.format(table=table))
+    return table
+
+
+def sheet_lock(connection, sheet):
+    """
+    Returns the lock for one worksheet's snapshot.
+    """
+    with SNAPSHOT_LOCK:
+        return SHEET_LOCKS.setdefault((connection, sheet), threading.Lock())
+
+
+def last_row(connection, sheet):
+    """
+    Returns the last worksheet row held in the snapshot.
+    Row 1 is the header, so an empty snapshot starts at 1.
+    """
+    found = connection.execute(
+        "SELECT last_row FROM revision WHERE sheet = ?", (sheet,)
+    ).fetchone()
+    return found[0] if found else 1
+
+
+def read_rows(worksheet, columns, start_row):
+    """
+    Reads the worksheet rows from start_row on as
+    (row number, *values) tuples.
+    """
+    return [
+        (row_number, *row)
+        for row_number, row in iter_rows(
+            worksheet, width=len(columns), start_row=start_row,
+            label="snapshot_refresh"
+        )
+    ]
+
+
+def still_holds(connection, sheet, table, columns, row):
+    """
+    Checks if a worksheet row read back still matches the row
+    the snapshot holds at that number, on the marker columns.
+    """
+    names = MARKER_COLUMNS.get(sheet, USERDATA_MARKER_COLUMNS)
+    stored = connection.execute(
+        f"SELECT {', '.join(names)} FROM {table} WHERE row = ?", (row[0],)
+    ).fetchone()
+    return stored is not None and list(stored) == [
+        row[columns.index(name) + 1] for name in names
+    ]
+
+
+def refresh(connection, sheet, worksheet):
+    """
+    Reads only the rows appended since the last refresh
+    and adds them to the snapshot.
+    The last row seen is read again with them, and if it no
+    longer holds the same row, for example after compaction or
+    rebalancing on another host, the snapshot is rebuilt.
+    The caller holds the sheet's lock; SNAPSHOT_LOCK is only
+    taken around the SQLite work, not the worksheet reads.
+    Returns the number of new rows.
+    """
+    columns = USERS_COLUMNS if sheet == "users" else USERDATA_COLUMNS
+    with SNAPSHOT_LOCK:
+        table = table_name(connection, sheet)
+        marker = last_row(connection, sheet)
+    rows = read_rows(worksheet, columns, max(marker, 2))
+    stale = False
+    if marker > 1:
+        with SNAPSHOT_LOCK:
+            holds = rows and rows[0][0] == marker and still_holds(
+                connection, sheet, table, columns, rows[0]
+            )
+        if holds:
+            rows = rows[1:]
+        else:
+            stale = True
+            rows = read_rows(worksheet, columns, 2)
+    with SNAPSHOT_LOCK, connection:
+        if stale:
+            connection.execute(f"DELETE FROM {table}")
+        connection.executemany(
+            f"INSERT OR REPLACE INTO {table} (row, {', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * (len(columns) + 1))})",
+            rows
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO revision VALUES (?, ?, ?)",
+            (sheet, rows[-1][0] if rows else 1 if stale else marker,
+             time.time())
+        )
+    return len(rows)
+
+
+def reset(sheet, path=None):
+    """
+    Drops the snapshot of a worksheet, for example after rows
+    were removed and row numbers moved.
+    The next lookup reloads it from the worksheet.
+    """
+    connection = get_connection(path)
+    with sheet_lock(connection, sheet), SNAPSHOT_LOCK, connection:
+        connection.execute(f"DELETE FROM {table_name(connection, sheet)}")
+        connection.execute("DELETE FROM revision WHERE sheet = ?", (sheet,))
+
+
+def lookup(sheet, username, worksheet, query, path=None):
+    """
+    Runs query for username against the snapshot.
+    The query names its table as {table}.
+    On a miss, refreshes the snapshot with any new rows and tries again.
+    Only one thread refreshes a sheet at a time, and threads that
+    waited for it try the snapshot again before reading the sheet.
+    """
+    connection = get_connection(path)
+    with SNAPSHOT_LOCK:
+        query = query.format(table=table_name(connection, sheet))
+        found = connection.execute(query, (username,)).fetchone()
+    if found is None:
+        with sheet_lock(connection, sheet):
+            with SNAPSHOT_LOCK:
+                found = connection.execute(query, (username,)).fetchone()
+            if found is None and refresh(connection, sheet, worksheet):
+                with SNAPSHOT_LOCK:
+                    found = connection.execute(
+                        query, (username,)
+                    ).fetchone()
+    inc("rehab_snapshot_lookups_total",
+        result="hit" if found is not None else "miss")
+    return found
+
+
+def lookup_user(username, worksheet, path=None):
+    """
+    Finds a user in the users snapshot.
+    Returns (row number, password) or None.
+    """
+    return lookup(
+        "users",
+        username,
+        worksheet,
+        "SELECT row, password FROM users WHERE username = ? "
+        "ORDER BY row LIMIT 1",
+        path
+    )
+
+
+def lookup_metric_row(username, worksheet, path=None):
+    """
+    Finds the latest row for a user in the snapshot of a userdata
+    worksheet, which may be one of several shards.
+    Returns the row values as a list or None.
+    """
+    found = lookup(
+        worksheet.title,
+        username,
+        worksheet,
+        f"SELECT {', '.join(USERDATA_COLUMNS)} FROM {{table}} "
+        "WHERE username = ? ORDER BY row DESC LIMIT 1",
+        path
+    )
+    return list(found) if found else None
+
+
+def lookup_metric_row_number(username, worksheet, path=None):
+    """
+    Finds the latest row for a user in the snapshot of a userdata
+    worksheet, the cached username to row map used by upserts.
+    Returns the row number or None.
+    """
+    found = lookup(
+        worksheet.title,
+        username,
+        worksheet,
+        "SELECT row FROM {table} WHERE username = ? "
+        "ORDER BY row DESC LIMIT 1",
+        path
+    )
+    return found[0] if found else None
+
+
+def store_row(sheet, row_number, values, path=None):
+    """
+    Replaces one userdata row in the snapshot after it was
+    updated in place on, or appended to, the worksheet.
+    """
+    connection = get_connection(path)
+    with sheet_lock(connection, sheet), SNAPSHOT_LOCK, connection:
+        connection.execute(
+            f"INSERT OR REPLACE INTO {table_name(connection, sheet)} "
+            f"(row, {', '.join(USERDATA_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * (len(USERDATA_COLUMNS) + 1))})",
+            (row_number, *values)
+        )
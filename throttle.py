@@ -0,0 +1,123 @@
+# Standard library imports
+import os
+import sqlite3
+import time
+
+# Local application imports
+from sheets import current_tenant
+
+# Login attempts allowed in a sliding window of LOGIN_WINDOW seconds,
+# per username and per connection
+LOGIN_WINDOW = float(os.environ.get("REHAB_LOGIN_WINDOW", "300"))
+USERNAME_ATTEMPTS = int(os.environ.get("REHAB_LOGIN_ATTEMPTS", "5"))
+CONNECTION_ATTEMPTS = int(os.environ.get("REHAB_CONNECTION_ATTEMPTS", "10"))
+
+# Identifies the client connection; the terminal server starts one
+# process per connection, so the process id is the fallback
+CONNECTION_ID = os.environ.get("REHAB_CONNECTION_ID", f"pid:{os.getpid()}")
+
+# Attempt times are kept in this SQLite file, shared by every
+# process on the host, so reconnecting does not reset the windows
+ATTEMPTS_DB = os.environ.get("REHAB_ATTEMPTS_DB", "login_attempts.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_by_key ON attempts (scope, key, at);
+CREATE INDEX IF NOT EXISTS attempts_by_time ON attempts (at);
+"""
+
+
+def connect(path=None):
+    """
+    Opens the shared attempts database.
+    Transactions are started explicitly, so a check and the
+    attempt it records are one step across processes.
+    """
+    connection = sqlite3.connect(
+        path or ATTEMPTS_DB, timeout=5, isolation_level=None
+    )
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def recent(connection, scope, key):
+    """
+    Returns (attempts, oldest attempt time) for a key
+    inside the window.
+    """
+    return connection.execute(
+        "SELECT COUNT(*), MIN(at) FROM attempts WHERE scope = ? AND key = ?",
+        (scope, key)
+    ).fetchone()
+
+
+def allow_login(username, connection=CONNECTION_ID, now=None, path=None):
+    """
+    Checks a login attempt against the per-username and
+    per-connection limits, without any network call.
+    With no connection only the per-username limit applies.
+    An allowed attempt is counted against both.
+    Attempts older than the window are dropped as it goes,
+    so the database only holds the current window.
+    If the database cannot be used the attempt is allowed,
+    so a full or read-only disk never locks patients out.
+    Returns (allowed, scope that refused it, seconds to wait).
+    """
+    now = time.time() if now is None else now
+    limits = [
+        ("username", f"{current_tenant()}:{username.lower()}",
+         USERNAME_ATTEMPTS),
+    ]
+    if connection:
+        limits.append(("connection", connection, CONNECTION_ATTEMPTS))
+    try:
+        database = connect(path)
+    except sqlite3.Error:
+        return True, None, 0
+    try:
+        database.execute("BEGIN IMMEDIATE")
+        try:
+            database.execute(
+                "DELETE FROM attempts WHERE at <= ?", (now - LOGIN_WINDOW,)
+            )
+            for scope, key, limit in limits:
+                count, oldest = recent(database, scope, key)
+                if count >= limit:
+                    database.execute("COMMIT")
+                    return False, scope, oldest + LOGIN_WINDOW - now
+            database.executemany(
+                "INSERT INTO attempts VALUES (?, ?, ?)",
+                [(scope, key, now) for scope, key, _ in limits]
+            )
+            database.execute("COMMIT")
+        except BaseException:
+            database.execute("ROLLBACK")
+            raise
+    except sqlite3.Error:
+        pass
+    finally:
+        database.close()
+    return True, None, 0
+
+
+def login_succeeded(username, path=None):
+    """
+    Clears a username's attempts after a successful login.
+    """
+    try:
+        database = connect(path)
+    except sqlite3.Error:
+        return
+    try:
+        database.execute(
+            "DELETE FROM attempts WHERE scope = 'username' AND key = ?",
+            (f"{current_tenant()}:{username.lower()}",)
+        )
+    except sqlite3.Error:
+        pass
+    finally:
+        database.close()
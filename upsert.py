@@ -0,0 +1,103 @@
+# Standard library imports
+import os
+
+# Local application imports
+from safe_writes import append_once
+from sharding import WRITE_BATCH, open_or_create
+from sheet_reader import USERDATA_COLUMNS, column_letter, read_range
+from sheets import current_tenant, get_spreadsheet, load_tenants
+from snapshot import lookup_metric_row_number, reset, store_row
+
+# 'append' adds a row per submission, 'upsert' keeps one current
+# row per user and moves earlier values to the history worksheet.
+# A tenant can override this with "storage_mode" in its config.
+STORAGE_MODE = os.environ.get("REHAB_STORAGE_MODE", "append")
+
+HISTORY_WORKSHEET = "userdata-history"
+
+LAST_COLUMN = column_letter(len(USERDATA_COLUMNS))
+SUBMISSION_ID_INDEX = USERDATA_COLUMNS.index("submission_id")
+
+
+def upsert_enabled(tenant=None):
+    """
+    Checks if a tenant stores one current row per user.
+    """
+    config = load_tenants()[tenant or current_tenant()]
+    return config.get("storage_mode", STORAGE_MODE) == "upsert"
+
+
+def read_row(worksheet, row_number):
+    """
+    Reads one userdata row by number, padded to every column.
+    """
+    values = read_range(
+        worksheet, f"A{row_number}:{LAST_COLUMN}{row_number}",
+        "read_current_row"
+    )
+    row = values[0] if values else []
+    return row + [""] * (len(USERDATA_COLUMNS) - len(row))
+
+
+def current_row(username, worksheet):
+    """
+    Finds a user's current row through the cached username to
+    row map, then reads just that row from the worksheet, so
+    values updated by other processes are never stale.
+    If the map points at another user's row, for example after
+    compaction, it is rebuilt once.
+    Returns (row number, values) or (None, None).
+    """
+    for _ in range(2):
+        row_number = lookup_metric_row_number(username, worksheet)
+        if row_number is None:
+            return None, None
+        values = read_row(worksheet, row_number)
+        if values[0] == username:
+            return row_number, values
+        reset(worksheet.title)
+    return None, None
+
+
+def upsert_rows(worksheet, rows):
+    """
+    Writes rows so each user keeps exactly one current row.
+    Users with a row have it updated in place, after its earlier
+    values are appended to the history worksheet in one batch.
+    New users are appended. A row whose submission id is already
+    current is skipped, so replayed writes are harmless.
+    Returns the number of rows updated in place.
+    """
+    updates = {}
+    history = []
+    for row in rows:
+        if row[0] in updates:
+            row_number, earlier = updates[row[0]]
+            history.append(earlier)
+            updates[row[0]] = (row_number, row)
+            continue
+        row_number, previous = current_row(row[0], worksheet)
+        if row_number is None:
+            append_once(worksheet, row, SUBMISSION_ID_INDEX + 1, True)
+            continue
+        if previous[SUBMISSION_ID_INDEX] == row[SUBMISSION_ID_INDEX]:
+            continue
+        history.append(previous)
+        updates[row[0]] = (row_number, row)
+    if history:
+        history_worksheet = open_or_create(
+            get_spreadsheet(current_tenant()), HISTORY_WORKSHEET
+        )
+        for start in range(0, len(history), WRITE_BATCH):
+            history_worksheet.append_rows(history[start:start + WRITE_BATCH])
+    if updates:
+        worksheet.batch_update([
+            {
+                "range": f"A{row_number}:{LAST_COLUMN}{row_number}",
+                "values": [row]
+            }
+            for row_number, row in updates.values()
+        ])
+        for row_number, row in updates.values():
+            store_row(worksheet.title, row_number, row)
+    return len(updates)
@@ -0,0 +1,267 @@
+# Standard library imports
+import re
+from datetime import date
+
+# Third party imports
+from colorama import Fore, Style
+
+NOT_VALID = (
+    '!', '?', '@', '*', '^', '.', '£', '$', '%', ',', '~', '`',
+    '+', '=', '<', '>', '|', '\\', '/', '[', ']', '{', '}', '#', ' '
+)
+
+# ROM (Range of Motion) conversion
+ROM_CONVERSION = {
+    "a": "Less than 45°",
+    "b": "Less than 90°",
+    "c": "Approximately 90°",
+    "d": "Greater than 100°",
+    "e": "Greater than 120°",
+}
+
+ROM_DEGREES = {
+    "a": 45,
+    "b": 89,
+    "c": 90,
+    "d": 100,
+    "e": 120
+}
+
+# Weight Bearing conversion
+WEIGHT_BEARING_CONVERSION = {
+    "a": "0-25% weight-bearing",
+    "b": "50-75% weight-bearing",
+    "c": "75%+ weight-bearing",
+    "d": "100% weight-bearing"
+}
+
+# Reverse lookups from worksheet text back to answer codes
+ROM_BY_TEXT = {text: code for code, text in ROM_CONVERSION.items()}
+WEIGHT_BEARING_BY_TEXT = {
+    text: code for code, text in WEIGHT_BEARING_CONVERSION.items()
+}
+
+# Precompiled lookups used by the parsers below
+INVALID_CHARS = frozenset(NOT_VALID)
+DATE_PATTERN = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+YES_ANSWERS = frozenset(("yes", "y", "yep"))
+NO_ANSWERS = frozenset(("no", "n", "nope"))
+PAIN_LEVELS = {str(level): level for level in range(11)}
+MAX_TRACKING_DAYS = 730
+
+NAME_LENGTH_ERROR = (
+    Fore.RED +
+    "Username must be between 2 and 10 characters." +
+    Style.RESET_ALL
+)
+NAME_CHARS_ERROR = (
+    Fore.RED +
+    "Invalid name. Please avoid special characters and spaces." +
+    Style.RESET_ALL
+)
+PASSWORD_LENGTH_ERROR = (
+    Fore.RED +
+    "Password must be at least 6 characters long." +
+    Style.RESET_ALL
+)
+PASSWORD_SPACE_ERROR = (
+    Fore.RED +
+    "Password cannot contain spaces." +
+    Style.RESET_ALL
+)
+DATE_FORMAT_ERROR = "Please enter your surgery date in DD/MM/YYYY format."
+DATE_FUTURE_ERROR = (
+    "The surgery date cannot be in the future.\n"
+    "If you've had your surgery today it may best "
+    "to use this tool tomorrow :)\n"
+    "Please check the date entered and try again."
+)
+DATE_RANGE_ERROR = (
+    Fore.RED +
+    "Surgery date should be within 2 years for tracking. " +
+    "Please consult your healthcare provider." +
+    Style.RESET_ALL
+)
+PAIN_RANGE_ERROR = (
+    Fore.RED +
+    "Please enter a number between 0 and 10." +
+    Style.RESET_ALL
+)
+PAIN_NUMBER_ERROR = (
+    Fore.RED +
+    "Pain level must be a whole number" +
+    Style.RESET_ALL
+)
+ROM_ERROR = (
+    Fore.RED +
+    "Please choose A, B, C, D or E." +
+    Style.RESET_ALL
+)
+WEIGHT_BEARING_ERROR = (
+    Fore.RED +
+    "Please choose A, B, C or D.\n" +
+    Style.RESET_ALL
+)
+
+
+def parse_name(text):
+    """
+    Parses a username or first name.
+    Must be 2-10 characters long.
+    Must not contain special characters or spaces.
+    Returns (is_valid, message, name).
+    """
+    if len(text) < 2 or len(text) > 10:
+        return False, NAME_LENGTH_ERROR, None
+    if not INVALID_CHARS.isdisjoint(text):
+        return False, NAME_CHARS_ERROR, None
+    return True, "", text
+
+
+def parse_password(text):
+    """
+    Parses a password.
+    Ensures minimum 6 characters length and no spaces.
+    Returns (is_valid, message, password).
+    """
+    if len(text) < 6:
+        return False, PASSWORD_LENGTH_ERROR, None
+    if ' ' in text:
+        return False, PASSWORD_SPACE_ERROR, None
+    return True, "", text
+
+
+def parse_date(text):
+    """
+    Parses a DD/MM/YYYY date without going through strptime.
+    Returns a date object or None if the text is not a valid date.
+    """
+    match = DATE_PATTERN.fullmatch(text)
+    if match is None:
+        return None
+    day, month, year = match.groups()
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def parse_surgery_date(text, today=None):
+    """
+    Parses the surgery date and checks its range.
+    Cannot be in future or older than 2 years.
+    Returns (is_valid, message, (surgery date, days since surgery)).
+    """
+    surgery_date = parse_date(text)
+    if surgery_date is None:
+        return False, DATE_FORMAT_ERROR, None
+    days_ago = ((today or date.today()) - surgery_date).days
+    if days_ago <= 0:
+        return False, DATE_FUTURE_ERROR, None
+    if days_ago > MAX_TRACKING_DAYS:
+        return False, DATE_RANGE_ERROR, None
+    return (
+        True,
+        f"Surgery was {days_ago} days ago on {text}.",
+        (surgery_date, days_ago)
+    )
+
+
+def parse_complications(text):
+    """
+    Parses the complications answer.
+    Accepts yes/no and variations (y/n, yep/nope).
+    Returns (is_valid, message, True if complications reported).
+    """
+    answer = text.lower().strip()
+    if answer in NO_ANSWERS:
+        return True, "", False
+    if answer in YES_ANSWERS:
+        return True, "", True
+    return False, "", None
+
+
+def parse_pain_scale(text):
+    """
+    Parses the pain scale answer (0-10).
+    Returns (is_valid, message, pain level as int).
+    """
+    num = PAIN_LEVELS.get(text)
+    if num is None:
+        try:
+            num = int(text)
+        except ValueError:
+            return False, PAIN_NUMBER_ERROR, None
+        if not 0 <= num <= 10:
+            return False, PAIN_RANGE_ERROR, None
+    return True, f"Your pain level is {num}/10.", num
+
+
+def parse_rom(text):
+    """
+    Parses the knee bend answer.
+    Returns (is_valid, message, ROM choice code).
+    """
+    choice = text.lower().strip()
+    if choice in ROM_CONVERSION:
+        return True, f"Knee bend: {ROM_CONVERSION[choice]}", choice
+    return False, ROM_ERROR, None
+
+
+def parse_weight_bearing(text):
+    """
+    Parses the weight bearing answer.
+    Returns (is_valid, message, weight bearing choice code).
+    """
+    if text is None:
+        return False, "Please choose A, B, C or D.", None
+    selection = text.lower().strip()
+    if selection in WEIGHT_BEARING_CONVERSION:
+        return True, WEIGHT_BEARING_CONVERSION[selection], selection
+    return False, WEIGHT_BEARING_ERROR, None
+
+
+# Parsers for each question id, shared by the terminal and bulk paths
+PARSERS = {
+    "name": parse_name,
+    "surgery_date": parse_surgery_date,
+    "complications": parse_complications,
+    "pain": parse_pain_scale,
+    "rom": parse_rom,
+    "weight_bearing": parse_weight_bearing,
+}
+
+
+def needs_safety_stop(question_id, value):
+    """
+    Checks if a parsed answer means the assessment should stop
+    and the user should seek advice from a healthcare professional.
+    """
+    if question_id == "complications":
+        return value is True
+    if question_id == "pain":
+        return value == 10
+    if question_id == "weight_bearing":
+        return value == "a"
+    return False
+
+
+def parse_answers(answers):
+    """
+    Parses a dictionary of raw answers keyed by question id,
+    for example a record from a bulk import.
+    Answers that need a safety stop are reported as errors.
+    Returns (parsed values, error messages) dictionaries.
+    """
+    parsed = {}
+    errors = {}
+    for question_id, parser in PARSERS.items():
+        text = str(answers.get(question_id, "")).strip()
+        is_valid, message, value = parser(text)
+        if not is_valid:
+            errors[question_id] = message or "Invalid answer."
+        elif needs_safety_stop(question_id, value):
+            errors[question_id] = "Please consult a healthcare professional."
+        else:
+            parsed[question_id] = value
+    return parsed, errors
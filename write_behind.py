@@ -0,0 +1,268 @@
+# Standard library imports
+import fcntl
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from functools import lru_cache
+
+# Local application imports
+from sheets import current_tenant, tenant_path, use_tenant
+
+# Rows that could not be written before exit are kept here
+# and queued again by the next session
+JOURNAL_FILE = os.environ.get("REHAB_WRITE_JOURNAL", "pending_writes.jsonl")
+# Each queued row is first written to this process's own copy,
+# JOURNAL_FILE.<pid>.pending, and removed once saved, so a process
+# killed with rows still queued leaves them for the next session
+PENDING_SUFFIX = "pending"
+PENDING_LOCK = threading.Lock()
+PENDING_PATHS = set()
+# Seconds to wait at exit for queued writes to finish
+WRITE_TIMEOUT = float(os.environ.get("REHAB_WRITE_TIMEOUT", "15"))
+
+QUEUE = queue.Queue()
+STATE = {"queued": 0, "saved": 0, "in_flight": [], "failed": []}
+DONE = threading.Condition()
+
+
+@lru_cache(maxsize=None)
+def start_writer():
+    """
+    Starts the writer thread on first use.
+    It is a daemon thread, so a write stuck on the network
+    never holds up the process exit past flush's timeout.
+    """
+    writer = threading.Thread(target=write_loop, name="write-behind",
+                              daemon=True)
+    writer.start()
+    return writer
+
+
+def write_loop():
+    """
+    Writes queued rows one at a time, in the order they were queued.
+    """
+    while True:
+        write, tenant, row, replayed = QUEUE.get()
+        error = None
+        try:
+            use_tenant(tenant)
+            write(row, replayed)
+        except Exception as e:
+            error = e
+        if error is None:
+            forget_pending(tenant, row)
+        with DONE:
+            STATE["in_flight"].remove((tenant, row))
+            if error is None:
+                STATE["saved"] += 1
+            else:
+                STATE["failed"].append((tenant, row, error))
+            DONE.notify_all()
+
+
+def enqueue(write, row):
+    """
+    Queues row to be written by write(row, replayed) in the
+    background, for the calling thread's tenant.
+    Rows left in the tenant's journal by an earlier session
+    are queued first, with replayed set, as they may have
+    been written after all.
+    Every row is written to this process's pending journal
+    before it is queued, so none is lost if the process is
+    killed before the writer gets to it.
+    """
+    start_writer()
+    tenant = current_tenant()
+    replayed = take_journal(tenant)
+    entries = replayed + [(tenant, row)]
+    record_pending(entries)
+    for journaled_tenant, journaled_row in replayed:
+        add(write, journaled_tenant, journaled_row, True)
+    add(write, tenant, row, False)
+
+
+def add(write, tenant, row, replayed):
+    """
+    Puts one row on the queue and counts it as in flight.
+    """
+    with DONE:
+        STATE["queued"] += 1
+        STATE["in_flight"].append((tenant, row))
+    QUEUE.put((write, tenant, row, replayed))
+
+
+def process_alive(pid):
+    """
+    Checks if a process id belongs to a running process.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def pending_path(tenant):
+    """
+    Returns this process's pending journal for a tenant.
+    """
+    return (
+        f"{tenant_path(JOURNAL_FILE, tenant)}.{os.getpid()}."
+        f"{PENDING_SUFFIX}"
+    )
+
+
+def record_pending(entries):
+    """
+    Appends (tenant, row) pairs to this process's pending journals.
+    Only this process writes them, so a thread lock is enough.
+    """
+    with PENDING_LOCK:
+        for tenant, row in entries:
+            PENDING_PATHS.add(pending_path(tenant))
+            with open(pending_path(tenant), "a", encoding="utf8") as journal:
+                journal.write(json.dumps({"tenant": tenant, "row": row}))
+                journal.write("\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+
+def forget_pending(tenant, row):
+    """
+    Removes a saved row from this process's pending journal.
+    The file is rewritten to a temporary name and swapped in,
+    so a crash part way through never loses the other rows.
+    """
+    path = pending_path(tenant)
+    line = json.dumps({"tenant": tenant, "row": row}) + "\n"
+    with PENDING_LOCK:
+        try:
+            with open(path, encoding="utf8") as journal:
+                lines = journal.readlines()
+        except FileNotFoundError:
+            return
+        if line in lines:
+            lines.remove(line)
+        if not lines:
+            os.remove(path)
+            return
+        with open(f"{path}.tmp", "w", encoding="utf8") as journal:
+            journal.writelines(lines)
+        os.replace(f"{path}.tmp", path)
+
+
+def clear_pending():
+    """
+    Removes this process's pending journals, once their rows
+    are saved or moved to the shared journals.
+    """
+    with PENDING_LOCK:
+        for path in PENDING_PATHS:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        PENDING_PATHS.clear()
+
+
+def claim_files(path):
+    """
+    Returns journal copies left claimed, and pending journals
+    left, by processes that exited before reading or saving them.
+    Their names are the journal's name, the process id and,
+    for pending journals, PENDING_SUFFIX.
+    """
+    claims = []
+    for claim in glob.glob(f"{glob.escape(path)}.*"):
+        parts = claim[len(path) + 1:].split(".")
+        if parts[1:] not in ([], [PENDING_SUFFIX]):
+            continue
+        if parts[0].isdigit() and not process_alive(int(parts[0])):
+            claims.append(claim)
+    return claims
+
+
+def take_journal(tenant):
+    """
+    Reads and removes a tenant's journal.
+    The journal is first claimed by renaming it to a name of this
+    process's own, so rows journaled meanwhile start a new file
+    and no two processes replay the same file. The claimed copy is
+    locked before it is read, to wait for a writer that opened it
+    just before the rename. Unreadable lines are skipped.
+    Returns a list of (tenant, row) pairs.
+    """
+    path = tenant_path(JOURNAL_FILE, tenant)
+    claimed = f"{path}.{os.getpid()}"
+    entries = []
+    for source in [path] + claim_files(path):
+        try:
+            os.replace(source, claimed)
+            with open(claimed, encoding="utf8") as journal:
+                fcntl.flock(journal, fcntl.LOCK_EX)
+                lines = journal.readlines()
+            os.remove(claimed)
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass
+    return [(entry["tenant"], entry["row"]) for entry in entries]
+
+
+def journal_rows(entries):
+    """
+    Appends (tenant, row) pairs to their tenants' journals.
+    Each write holds the journal's lock, and is made again if the
+    file was claimed by take_journal before the lock was taken.
+    """
+    for tenant, row in entries:
+        path = tenant_path(JOURNAL_FILE, tenant)
+        line = json.dumps({"tenant": tenant, "row": row}) + "\n"
+        while True:
+            with open(path, "a", encoding="utf8") as journal:
+                fcntl.flock(journal, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(path).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current != os.fstat(journal.fileno()).st_ino:
+                    continue
+                journal.write(line)
+                break
+
+
+def flush(timeout=WRITE_TIMEOUT):
+    """
+    Waits up to timeout seconds for queued writes to finish.
+    Rows still in flight or that failed are saved to the journal,
+    so they are written by a later session instead of being lost.
+    A row written late as well as journaled is not duplicated,
+    as replayed rows are looked up by submission id first.
+    Returns (rows saved, rows journaled, errors).
+    """
+    deadline = time.monotonic() + timeout
+    with DONE:
+        while STATE["in_flight"]:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            DONE.wait(remaining)
+        left = list(STATE["in_flight"])
+        failed = STATE["failed"]
+        STATE["failed"] = []
+    journal_rows(left + [(tenant, row) for tenant, row, _ in failed])
+    clear_pending()
+    return (
+        STATE["saved"],
+        len(left) + len(failed),
+        [error for _, _, error in failed]
+    )